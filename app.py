@@ -9,97 +9,421 @@ Features:
 - 24-hour cache expiry with automatic daily updates
 """
 
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, g, jsonify, request, render_template, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+from cachetools import LRUCache, TTLCache, cached
+import orjson
 import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from datetime import datetime, timedelta
 import time
 import os
+import math
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import hashlib
 import atexit
+import threading
+from contextlib import contextmanager
 
 # Import caching and background updater
-from station_cache import get_cache, StationCache
-from background_updater import init_updater, get_updater, BackgroundUpdater
+from station_cache import get_cache, StationCache, TokenBucket, CACHE_EXPIRY_HOURS, STALE_AFTER_HOURS
+from background_updater import init_updater, get_updater, BackgroundUpdater, RequestBatcher
+from chargemyhyundai_api import EMPTY_FILTER_CRITERIA, parse_price_components
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson (much faster on large station lists) for responses and request bodies"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        # Also used by request.json / request.get_json()
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
+
+# Log through a queue so request threads never block writing to stdout; a
+# background listener thread does the actual output
+log_queue = queue.Queue(-1)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+    handlers=[QueueHandler(log_queue)],
+    force=True
+)
+log_listener = QueueListener(log_queue, logging.StreamHandler(), respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+logger = logging.getLogger(__name__)
+
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
+app.json = ORJSONProvider(app)
 CORS(app)
 
+# Compress responses (the station/price JSON is very repetitive and shrinks ~10x)
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html', 'text/css', 'application/javascript']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+
+
+class CompressedBodyCache:
+    """Flask-Compress cache backend for bodies served with a content ETag (see cached_body_response)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bodies = TTLCache(maxsize=512, ttl=3600)
+    
+    def get(self, key):
+        with self._lock:
+            return self._bodies.get(key)
+    
+    def set(self, key, value):
+        # Keys end in ';' for responses without a content ETag, which must not be cached
+        if not key.endswith(';'):
+            with self._lock:
+                self._bodies[key] = value
+
+
+# The same ETag always means the same body, so each cached upstream body is
+# compressed once per algorithm instead of on every hit
+app.config['COMPRESS_CACHE_BACKEND'] = CompressedBodyCache
+app.config['COMPRESS_CACHE_KEY'] = lambda req: g.get('body_etag', '')
+Compress(app)
+
 # API Configuration
 BASE_URL = "https://chargemyhyundai.com/api/map/v1"
 DEFAULT_MARKET = "de"
 DEFAULT_LOCALE = "de_DE"
 
-# CPO cache (operator names)
-cpo_cache = {}
-cpo_cache_time = None
+# In-memory caches with per-entry expiry and a size bound (guarded by cache_lock)
+cache_lock = threading.Lock()
+
+# CPO cache (operator names, refreshed daily)
+cpo_cache = TTLCache(maxsize=4096, ttl=86400)
 
-# Cache for tariffs (refreshed every hour)
-tariff_cache = {}
-tariff_cache_time = None
+# Last good tariffs per market, never expired: served (marked X-Cache: STALE)
+# when the API is down and the TTL cache has run out
+stale_tariff_cache = LRUCache(maxsize=32)
+
+# Cluster responses for recently viewed map areas, keyed by the snapped bounding box
+stations_cache = TTLCache(maxsize=2048, ttl=30)
+
+# Market list (changes rarely)
+markets_cache = TTLCache(maxsize=8, ttl=3600)
+
+# Stale stations already queued for a background refresh (so each is queued once)
+refresh_requested = TTLCache(maxsize=16384, ttl=3600)
+
+# Stations whose access was recorded recently (accessed_at is only written hourly)
+recently_accessed = TTLCache(maxsize=16384, ttl=3600)
 
 # Initialize station cache
 station_cache = get_cache()
 
-# Initialize and start background updater (session is no longer used, updater creates fresh sessions)
-background_updater = init_updater(None, base_url=BASE_URL, default_market=DEFAULT_MARKET)
+# Initialize and start background updater (session is unused, the updater keeps its own pooled session)
+background_updater = init_updater(
+    None,
+    base_url=BASE_URL,
+    default_market=DEFAULT_MARKET,
+    snapshot_path=os.environ.get('UPDATER_SNAPSHOT_PATH')
+)
+
+
+# Process that started the updater; the shutdown handler only runs there
+updater_lock = threading.Lock()
+updater_pid = None
 
 
 def start_background_updater():
-    """Start the background updater (called after app initialization)"""
-    if background_updater and not background_updater.is_running():
-        background_updater.start()
-        print("📦 Background cache updater started")
+    """Start the background updater (called after app initialization, post-fork under gunicorn)"""
+    global updater_pid
+    with updater_lock:
+        if background_updater and not background_updater.is_running():
+            background_updater.start()
+            logger.info("Background cache updater started")
+            
+            # Register the shutdown handler in the process that owns the
+            # updater, not at import time in a preloading parent
+            if updater_pid != os.getpid():
+                updater_pid = os.getpid()
+                atexit.register(stop_background_updater)
 
 
 def stop_background_updater():
     """Stop the background updater on shutdown"""
-    if background_updater and background_updater.is_running():
-        background_updater.stop()
-        print("📦 Background cache updater stopped")
-
-
-# Register shutdown handler
-atexit.register(stop_background_updater)
+    with updater_lock:
+        # Forked children inherit atexit handlers but not the updater thread
+        if updater_pid != os.getpid():
+            return
+        if background_updater and background_updater.is_running():
+            background_updater.stop()
+            logger.info("Background cache updater stopped")
 
 
 def create_api_session():
-    """Create a fresh session with proper headers for API calls"""
-    import requests as req
-    s = req.Session()
+    """Create a session with proper headers and a pooled, retrying adapter for API calls"""
+    s = requests.Session()
     s.headers.update({
         'Content-Type': 'application/json',
         'Accept': 'application/json, text/plain, */*',
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
         'Origin': 'https://chargemyhyundai.com',
-        'Referer': 'https://chargemyhyundai.com/web/de/hyundai-de/map'
+        'Referer': 'https://chargemyhyundai.com/web/de/hyundai-de/map',
+        'Connection': 'keep-alive'
     })
+    
+    # Never store upstream cookies: the session is shared by all users and threads,
+    # so every request goes out exactly like a fresh session would send it
+    s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    
+    # Keep TCP/TLS connections alive between requests and retry transient upstream errors
+    # (429s are retried by upstream(), which takes them through the rate limiter)
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=64,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            # The API's POST endpoints are read-only queries, so they are safe to retry too
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False  # Hand the last response back so callers can inspect it
+        )
+    )
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
     return s
 
 
+# Shared API session, reused by all routes so connections are pooled
+session = create_api_session()
+
+# Outbound rate limit for requests made on behalf of users (per worker process),
+# so traffic spikes don't get us throttled by the API
+UPSTREAM_RATE_LIMIT = float(os.environ.get('UPSTREAM_RATE_LIMIT', 5))  # Requests per second
+UPSTREAM_BURST = int(os.environ.get('UPSTREAM_BURST', 20))  # Requests allowed back to back
+UPSTREAM_RATE_LIMIT_TIMEOUT = 10  # Max seconds to wait for a free slot
+UPSTREAM_THROTTLED_RETRIES = 2  # Retries of a request answered with 429
+UPSTREAM_MAX_RETRY_AFTER = 5  # Max seconds to honour a 429's Retry-After before retrying
+# (connect, read) timeout so a hung upstream can't pin a worker thread indefinitely
+UPSTREAM_TIMEOUT = (5, float(os.environ.get('UPSTREAM_TIMEOUT', 20)))
+upstream_limiter = TokenBucket(UPSTREAM_RATE_LIMIT, UPSTREAM_BURST)
+
+# Maximum number of IDs accepted per request (larger requests are rejected with 400)
+MAX_POOL_IDS = int(os.environ.get('MAX_POOL_IDS', 500))
+MAX_CACHED_PRICE_POOLS = int(os.environ.get('MAX_CACHED_PRICE_POOLS', 200))
+MAX_PRICE_CHARGE_POINTS = int(os.environ.get('MAX_PRICE_CHARGE_POINTS', 20))
+
+# Worker threads for fanning out independent upstream requests in parallel
+upstream_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('UPSTREAM_WORKERS', 8)),
+    thread_name_prefix='upstream'
+)
+
+# Upstream fetches currently in flight, keyed by cache key (single-flight)
+_inflight = {}
+_inflight_lock = threading.Lock()
+INFLIGHT_TIMEOUT_SECONDS = 30
+
+
+def claim_inflight(keys):
+    """
+    Claim the upstream fetch for each key unless another request already does it.
+    Returns (claimed, pending): the keys this caller has to fetch itself and a
+    {key: event} dict for keys that are already being fetched by another thread.
+    """
+    claimed = []
+    pending = {}
+    with _inflight_lock:
+        for key in keys:
+            event = _inflight.get(key)
+            if event is None:
+                _inflight[key] = threading.Event()
+                claimed.append(key)
+            else:
+                pending[key] = event
+    return claimed, pending
+
+
+def release_inflight(keys):
+    """Release claimed keys and wake up all requests waiting for them"""
+    with _inflight_lock:
+        events = [_inflight.pop(key) for key in keys if key in _inflight]
+    for event in events:
+        event.set()
+
+
+@contextmanager
+def single_flight(key):
+    """
+    Collapse concurrent cache misses for the same key into one upstream call.
+    Yields True for the caller that should fetch; other callers block until it
+    is done and get False, after which they should re-read the cache.
+    """
+    claimed, pending = claim_inflight([key])
+    if pending:
+        pending[key].wait(INFLIGHT_TIMEOUT_SECONDS)
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        release_inflight(claimed)
+
+
+def cache_get(cache, key):
+    """Thread-safe lookup in one of the in-memory caches, returns None on a miss"""
+    with cache_lock:
+        return cache.get(key)
+
+
+def cache_set(cache, key, value):
+    """Thread-safe insert into one of the in-memory caches"""
+    with cache_lock:
+        cache[key] = value
+
+
+@lru_cache(maxsize=256)
+def api_url(path):
+    """Absolute ChargeMyHyundai API URL for a path (memoized, the same few paths come up over and over)"""
+    return f"{BASE_URL}/{path}"
+
+
+def upstream(method, path, **kwargs):
+    """Send a request to the ChargeMyHyundai API through the shared session, respecting the rate limit"""
+    kwargs.setdefault('timeout', UPSTREAM_TIMEOUT)
+    for attempt in range(UPSTREAM_THROTTLED_RETRIES + 1):
+        if not upstream_limiter.acquire(timeout=UPSTREAM_RATE_LIMIT_TIMEOUT):
+            raise Exception("Upstream rate limit exceeded, please wait a moment")
+        response = session.request(method, api_url(path), **kwargs)
+        if response.status_code != 429 or attempt == UPSTREAM_THROTTLED_RETRIES:
+            return response
+        
+        # Throttled: back off, then try again through the limiter
+        retry_after = response.headers.get('Retry-After', '')
+        response.close()
+        time.sleep(min(float(retry_after), UPSTREAM_MAX_RETRY_AFTER) if retry_after.isdigit() else 2 ** attempt)
+
+
+def passthrough_response(response, on_complete=None):
+    """
+    Stream an upstream JSON response (requested with stream=True) to the client as-is,
+    without decoding and re-encoding it or holding the whole body in memory.
+    If on_complete is given, it is called with the full body once it has been sent.
+    """
+    def generate():
+        chunks = []
+        with response:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if on_complete:
+                    chunks.append(chunk)
+                yield chunk
+        if on_complete:
+            on_complete(b''.join(chunks))
+    
+    return app.response_class(
+        stream_with_context(generate()),
+        status=response.status_code,
+        content_type=response.headers.get('Content-Type', 'application/json')
+    )
+
+
+def cache_body(cache, key, content_type):
+    """on_complete callback for passthrough_response() that caches the body with its ETag"""
+    def store(body):
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        cache_set(cache, key, (etag, body, content_type))
+    return store
+
+
+def cached_body_response(cached):
+    """Serve an upstream body cached by cache_body(), or a 304 if the client already has it"""
+    etag, body, content_type = cached
+    response = not_modified(etag)
+    if response is None:
+        response = app.response_class(body, content_type=content_type)
+        response.set_etag(etag)
+        g.body_etag = etag
+    response.headers['X-Cache'] = 'HIT'
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    return response
+
+
+def auto_precision(lat_nw, lng_nw, lat_se, lng_se):
+    """
+    Pick a query precision for a bounding box when the client doesn't send one:
+    one step finer per halving of the box area, from 3 for a square degree or
+    more up to 12 for a box a few kilometres across.
+    """
+    area = max(abs((lat_nw - lat_se) * (lng_se - lng_nw)), 1e-9)
+    return max(3, min(12, round(3 - math.log2(area))))
+
+
+def snap_bounds(lat_nw, lng_nw, lat_se, lng_se, precision):
+    """
+    Snap a bounding box outwards to a grid that gets finer with the query precision
+    (~1 degree at precision 3, ~0.008 degrees at 10), so users looking at about the
+    same area share one cache entry. The snapped box always covers the original one.
+    """
+    cell = 8 / 2 ** max(0, min(precision, 20))
+    return (
+        round(math.ceil(lat_nw / cell) * cell, 6),
+        round(math.floor(lng_nw / cell) * cell, 6),
+        round(math.floor(lat_se / cell) * cell, 6),
+        round(math.ceil(lng_se / cell) * cell, 6)
+    )
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has the response identified by etag, else None"""
+    if_none_match = request.if_none_match
+    # Flask-Compress appends ':<algorithm>' to the ETag of compressed responses
+    if if_none_match.star_tag or any(tag.split(':')[0] == etag for tag in if_none_match.as_set()):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+# Tariffs are refreshed every hour; the condition makes concurrent callers
+# wait for a single upstream fetch instead of all missing at once
+@cached(cache=TTLCache(maxsize=32, ttl=3600), condition=threading.Condition())
 def get_tariffs(market=DEFAULT_MARKET):
     """Get tariffs with caching"""
-    global tariff_cache, tariff_cache_time
-    
-    cache_key = market
-    if cache_key in tariff_cache and tariff_cache_time:
-        if datetime.now() - tariff_cache_time < timedelta(hours=1):
-            return tariff_cache[cache_key]
-    
-    temp_session = create_api_session()
-    response = temp_session.get(
-        f"{BASE_URL}/{market}/tariffs",
+    response = upstream(
+        'GET', f"{market}/tariffs",
         params={"locale": DEFAULT_LOCALE}
     )
     response.raise_for_status()
     tariffs = response.json()
-    
-    tariff_cache[cache_key] = tariffs
-    tariff_cache_time = datetime.now()
-    
+    cache_set(stale_tariff_cache, market, tariffs)
     return tariffs
 
 
+def first_price(tariff, fee):
+    """Get the first listed price of one of a tariff's fixed fees, or 'N/A'"""
+    prices = ((tariff.get('fixedFees') or {}).get(fee) or {}).get('prices')
+    return prices[0].get('price', 'N/A') if prices else 'N/A'
+
+
 @app.route('/')
 def index():
     """Serve the main application"""
@@ -109,18 +433,31 @@ def index():
 @app.route('/api/tariffs')
 def api_tariffs():
     """Get available tariffs"""
+    stale = False
     try:
-        tariffs = get_tariffs()
-        simplified = []
-        for t in tariffs:
-            if not t.get('expired', False):
-                simplified.append({
-                    'id': t['id'],
-                    'name': t['name'],
-                    'baseFee': t.get('fixedFees', {}).get('baseFee', {}).get('prices', [{}])[0].get('price', 'N/A'),
-                    'activationFee': t.get('fixedFees', {}).get('activationFee', {}).get('prices', [{}])[0].get('price', 'N/A')
-                })
-        return jsonify(simplified)
+        try:
+            tariffs = get_tariffs()
+        except Exception as e:
+            # Keep the tariff selector working through upstream outages
+            tariffs = cache_get(stale_tariff_cache, DEFAULT_MARKET)
+            if tariffs is None:
+                return jsonify({'error': str(e)}), 503
+            stale = True
+        
+        simplified = [
+            {
+                'id': t['id'],
+                'name': t['name'],
+                'baseFee': first_price(t, 'baseFee'),
+                'activationFee': first_price(t, 'activationFee')
+            }
+            for t in tariffs if not t.get('expired', False)
+        ]
+        response = jsonify(simplified)
+        if stale:
+            response.headers['X-Cache'] = 'STALE'
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -130,9 +467,22 @@ def api_cached_stations():
     """
     Get all cached stations for fast initial display.
     Returns stations from the local cache without hitting the external API.
+    Pass ?fields=id,latitude,longitude,... to only return those station fields.
     """
     try:
         market = request.args.get('market', DEFAULT_MARKET)
+        fields = set(request.args.get('fields', '').split(',')) - {''}
+        
+        # The ETag only depends on the cache contents and the query, so repeat
+        # requests can be answered without loading or serializing any stations
+        last_updated, count = station_cache.get_stations_version(market)
+        etag = hashlib.blake2b(
+            f"{last_updated}|{count}|{request.query_string.decode()}".encode(), digest_size=8
+        ).hexdigest()
+        response = not_modified(etag)
+        if response:
+            return response
+        
         lat_nw = request.args.get('lat_nw')
         lng_nw = request.args.get('lng_nw')
         lat_se = request.args.get('lat_se')
@@ -150,39 +500,42 @@ def api_cached_stations():
             cached = station_cache.get_all_stations(market)
         
         # Transform to format expected by frontend
-        stations = []
-        for s in cached:
-            # Build chargePoints array from cached data
-            charge_points = []
-            for cp_id in (s.get('charge_points_ac') or []):
-                charge_points.append({'id': cp_id, 'powerType': 'AC'})
-            for cp_id in (s.get('charge_points_dc') or []):
-                charge_points.append({'id': cp_id, 'powerType': 'DC'})
-            
-            stations.append({
+        # (the cache always returns the list fields as lists, so index them directly)
+        stations = [
+            {
                 'id': s['pool_id'],
                 'latitude': s['latitude'],
                 'longitude': s['longitude'],
-                'chargePointCount': s.get('charge_point_count') or len(charge_points),
-                'dcsTcpoId': s.get('cpo_id'),
-                'chargePoints': charge_points,
-                'maxPower': s.get('max_power'),
-                'plugTypes': s.get('plug_types') or [],
+                'chargePointCount': s['charge_point_count'] or len(s['charge_points_ac']) + len(s['charge_points_dc']),
+                'dcsTcpoId': s['cpo_id'],
+                'chargePoints': [{'id': cp_id, 'powerType': 'AC'} for cp_id in s['charge_points_ac']]
+                              + [{'id': cp_id, 'powerType': 'DC'} for cp_id in s['charge_points_dc']],
+                'maxPower': s['max_power'],
+                'plugTypes': s['plug_types'],
                 'cached': True,
-                'cpoName': s.get('cpo_name'),
-                'locationName': s.get('location_name'),
-                'city': s.get('city'),
-                'street': s.get('street')
-            })
+                'cpoName': s['cpo_name'],
+                'locationName': s['location_name'],
+                'city': s['city'],
+                'street': s['street']
+            }
+            for s in cached
+        ]
         
-        return jsonify({
+        # Drop fields the client did not ask for
+        if fields:
+            stations = [{k: v for k, v in station.items() if k in fields} for station in stations]
+        
+        response = jsonify({
             'stations': stations,
             'count': len(stations),
             'source': 'cache'
         })
+        # Let browsers and proxies reuse the response for repeated polls
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        response.set_etag(etag)
+        return response
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in api_cached_stations")
         return jsonify({'error': str(e), 'stations': [], 'count': 0}), 500
 
 
@@ -194,8 +547,18 @@ def api_stations():
         lng_nw = float(request.args.get('lng_nw'))
         lat_se = float(request.args.get('lat_se'))
         lng_se = float(request.args.get('lng_se'))
-        precision = int(request.args.get('precision', 10))
         market = request.args.get('market', DEFAULT_MARKET)
+        if 'precision' in request.args:
+            precision = int(request.args['precision'])
+        else:
+            precision = auto_precision(lat_nw, lng_nw, lat_se, lng_se)
+        
+        # Query the snapped box so nearby viewports can be served from the cache
+        lat_nw, lng_nw, lat_se, lng_se = snap_bounds(lat_nw, lng_nw, lat_se, lng_se, precision)
+        cache_key = (market, precision, lat_nw, lng_nw, lat_se, lng_se)
+        cached = cache_get(stations_cache, cache_key)
+        if cached is not None:
+            return cached_body_response(cached)
         
         payload = {
             "searchCriteria": {
@@ -208,27 +571,23 @@ def api_stations():
                 "unpackClustersWithSinglePool": True
             },
             "withChargePointIds": True,
-            "filterCriteria": {
-                "authenticationMethods": [],
-                "cableAttachedTypes": [],
-                "paymentMethods": [],
-                "plugTypes": [],
-                "poolLocationTypes": [],
-                "valueAddedServices": [],
-                "dcsTcpoIds": []
-            }
+            "filterCriteria": EMPTY_FILTER_CRITERIA
         }
         
-        temp_session = create_api_session()
-        response = temp_session.post(
-            f"{BASE_URL}/{market}/query",
+        response = upstream(
+            'POST', f"{market}/query",
             json=payload,
-            headers={"rest-api-path": "clusters"}
+            headers={"rest-api-path": "clusters"},
+            stream=True
         )
         response.raise_for_status()
-        return jsonify(response.json())
+        content_type = response.headers.get('Content-Type', 'application/json')
+        return passthrough_response(
+            response,
+            on_complete=cache_body(stations_cache, cache_key, content_type)
+        )
     except Exception as e:
-        print(f"API Error in api_stations: {e}")
+        logger.exception("API Error in api_stations")
         return jsonify({'error': str(e)}), 500
 
 
@@ -236,13 +595,21 @@ def api_stations():
 def api_markets():
     """Get all available markets"""
     try:
-        temp_session = create_api_session()
-        response = temp_session.get(
-            f"{BASE_URL}/{DEFAULT_MARKET}/markets",
-            params={"locale": DEFAULT_LOCALE}
+        cached = cache_get(markets_cache, DEFAULT_MARKET)
+        if cached is not None:
+            return cached_body_response(cached)
+        
+        response = upstream(
+            'GET', f"{DEFAULT_MARKET}/markets",
+            params={"locale": DEFAULT_LOCALE},
+            stream=True
         )
         response.raise_for_status()
-        return jsonify(response.json())
+        content_type = response.headers.get('Content-Type', 'application/json')
+        return passthrough_response(
+            response,
+            on_complete=cache_body(markets_cache, DEFAULT_MARKET, content_type)
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -250,191 +617,199 @@ def api_markets():
 @app.route('/api/cpo/<cpo_id>')
 def api_cpo_info(cpo_id):
     """Get CPO information"""
-    global cpo_cache, cpo_cache_time
-    
     # Check cache
-    if cpo_id in cpo_cache:
-        return jsonify(cpo_cache[cpo_id])
+    cpo = cache_get(cpo_cache, cpo_id)
+    if cpo is not None:
+        return jsonify(cpo)
     
     try:
-        # Try to get CPO info from the API
-        temp_session = create_api_session()
-        response = temp_session.get(
-            f"{BASE_URL}/{DEFAULT_MARKET}/cpo/{cpo_id}",
-            params={"locale": DEFAULT_LOCALE}
-        )
-        if response.ok:
-            data = response.json()
-            cpo_cache[cpo_id] = data
-            return jsonify(data)
-        else:
-            # Return a placeholder if not found
-            return jsonify({'id': cpo_id, 'name': 'Unknown Operator'})
-    except Exception as e:
-        return jsonify({'id': cpo_id, 'name': 'Unknown Operator'})
+        # The SQLite cache is shared by all worker processes
+        cpo = station_cache.get_cpo(cpo_id)
+        if cpo is not None:
+            cache_set(cpo_cache, cpo_id, cpo)
+            return jsonify(cpo)
+        
+        with single_flight(('cpo', cpo_id)) as leader:
+            # Another request just fetched the same CPO
+            cpo = None if leader else cache_get(cpo_cache, cpo_id)
+            if cpo is not None:
+                return jsonify(cpo)
+            
+            # Try to get CPO info from the API
+            response = upstream(
+                'GET', f"{DEFAULT_MARKET}/cpo/{cpo_id}",
+                params={"locale": DEFAULT_LOCALE}
+            )
+            if response.ok:
+                data = response.json()
+                cache_set(cpo_cache, cpo_id, data)
+                station_cache.save_cpo(cpo_id, data)
+                return jsonify(data)
+            elif response.status_code < 500:
+                # Return a placeholder if not found
+                return jsonify({'id': cpo_id, 'name': 'Unknown Operator'})
+    except Exception:
+        pass
+    
+    # The API is unavailable: fall back to an expired cache entry if we have one
+    cpo = station_cache.get_cpo(cpo_id, max_age_hours=None)
+    if cpo is not None:
+        response = jsonify(cpo)
+        response.headers['X-Cache'] = 'STALE'
+        return response
+    return jsonify({'id': cpo_id, 'name': 'Unknown Operator'})
+
 
+# Field order of the columnar /api/pool-details response
+POOL_DETAIL_FIELDS = [
+    'pool_id', 'cpo_name', 'location_name', 'street', 'city', 'zip_code',
+    'max_power', 'plug_types', 'charge_points_ac', 'charge_points_dc',
+    'contact_name', 'contact_phone', 'cached', 'updated_at'
+]
 
-# Pool details cache
-pool_cache = {}
+
+def pool_info_from_cache(pool_id, station):
+    """Convert a cached station to the pool details format expected by the frontend"""
+    return {
+        'pool_id': pool_id,
+        'cpo_name': station.get('cpo_name', 'Unbekannt'),
+        'location_name': station.get('location_name'),
+        'street': station.get('street'),
+        'city': station.get('city'),
+        'zip_code': station.get('zip_code'),
+        'max_power': station.get('max_power'),
+        'plug_types': station.get('plug_types', []),
+        'charge_points_ac': station.get('charge_points_ac', []),
+        'charge_points_dc': station.get('charge_points_dc', []),
+        'contact_name': station.get('contact_name'),
+        'contact_phone': station.get('contact_phone'),
+        'cached': True,
+        'updated_at': station.get('updated_at')
+    }
+
+
+def fetch_pool_batch(pool_ids, market):
+    """Fetch pool details for one batch of pool IDs (empty list if the API refuses)"""
+    response = upstream(
+        'POST', f"{market}/query",
+        json={"dcsPoolIds": pool_ids},
+        headers={"rest-api-path": "pools"}
+    )
+    if not response.ok:
+        return []
+    return orjson.loads(response.content)
+
+
+def fetch_pools(pool_ids, market):
+    """Fetch pool details from the API in batches, save them to the cache and return them by pool ID"""
+    results = {}
+    
+    # Limit batch size
+    batch_size = 20
+    batches = [pool_ids[i:i + batch_size] for i in range(0, len(pool_ids), batch_size)]
+    
+    # Request all batches in parallel and process each one as soon as it arrives;
+    # a failed batch only loses its own pools
+    futures = [upstream_executor.submit(fetch_pool_batch, batch, market) for batch in batches]
+    for future in as_completed(futures):
+        try:
+            pools_data = future.result()
+        except Exception as e:
+            logger.warning("Error fetching pool batch: %s", e)
+            continue
+        
+        # Parsing and aggregation happen once, on the cache write (one transaction per batch)
+        updated_at = datetime.utcnow().isoformat()
+        for station in station_cache.save_pools(pools_data, market):
+            results[station['pool_id']] = {
+                **station,
+                'cached': False,
+                'updated_at': updated_at
+            }
+    
+    return results
 
 
 @app.route('/api/pool-details', methods=['POST'])
 def api_pool_details():
     """Get detailed pool information including CPO names and addresses.
     Uses SQLite cache for faster responses and reduced API load.
+    Send "format": "columnar" to get {"fields": [...], "rows": [[...], ...]}
+    instead of one object per pool (about half the size for large batches).
     """
     try:
         data = request.json
         pool_ids = data.get('pool_ids', [])
         market = data.get('market', DEFAULT_MARKET)
+        columnar = data.get('format') == 'columnar'
         
         if not pool_ids:
             return jsonify({'error': 'No pool IDs provided'}), 400
         
+        # Drop duplicates (same pool in several clusters) while keeping order
+        pool_ids = list(dict.fromkeys(pool_ids))
+        if len(pool_ids) > MAX_POOL_IDS:
+            return jsonify({'error': f'Too many pool IDs (max {MAX_POOL_IDS})'}), 400
+        
         # Check SQLite cache first
         cached_results = station_cache.get_stations(pool_ids)
         
-        # Convert cached results to expected format
+        # Serve stale stations as they are and refresh them in the background;
+        # only expired ones are fetched again right away
+        now = datetime.utcnow()
+        expired_before = (now - timedelta(hours=CACHE_EXPIRY_HOURS)).isoformat()
+        stale_before = (now - timedelta(hours=STALE_AFTER_HOURS)).isoformat()
         results = {}
+        stale_updates = []
         for pool_id, station in cached_results.items():
-            results[pool_id] = {
-                'pool_id': pool_id,
-                'cpo_name': station.get('cpo_name', 'Unbekannt'),
-                'location_name': station.get('location_name'),
-                'street': station.get('street'),
-                'city': station.get('city'),
-                'zip_code': station.get('zip_code'),
-                'max_power': station.get('max_power'),
-                'plug_types': station.get('plug_types', []),
-                'charge_points_ac': station.get('charge_points_ac', []),
-                'charge_points_dc': station.get('charge_points_dc', []),
-                'contact_name': station.get('contact_name'),
-                'contact_phone': station.get('contact_phone'),
-                'cached': True,
-                'updated_at': station.get('updated_at')
-            }
+            updated_at = station.get('updated_at') or ''
+            if updated_at < expired_before:
+                continue
+            if updated_at < stale_before and cache_get(refresh_requested, pool_id) is None:
+                cache_set(refresh_requested, pool_id, True)
+                stale_updates.append((pool_id, market, 1))
+            results[pool_id] = pool_info_from_cache(pool_id, station)
+        station_cache.queue_updates_bulk(stale_updates)
         
         # Find IDs that need to be fetched from API
-        uncached_ids = [pid for pid in pool_ids if pid not in cached_results]
-        
-        # Also check in-memory cache for backward compatibility
-        for pid in list(uncached_ids):
-            if pid in pool_cache:
-                results[pid] = pool_cache[pid]
-                results[pid]['cached'] = True
-                uncached_ids.remove(pid)
-        
-        # Fetch uncached pools in batches
-        if uncached_ids:
-            # Limit batch size
-            batch_size = 20
-            for i in range(0, len(uncached_ids), batch_size):
-                batch = uncached_ids[i:i + batch_size]
-                
-                temp_session = create_api_session()
-                response = temp_session.post(
-                    f"{BASE_URL}/{market}/query",
-                    json={"dcsPoolIds": batch},
-                    headers={"rest-api-path": "pools"}
-                )
-                
-                if response.ok:
-                    pools_data = response.json()
-                    for pool in pools_data:
-                        pool_id = pool.get('dcsPoolId')
-                        if not pool_id:
-                            continue
-                        
-                        # Extract useful information
-                        cpo_name = pool.get('technicalChargePointOperatorName', 'Unbekannt')
-                        
-                        # Get location details
-                        location_name = None
-                        street = None
-                        city = None
-                        zip_code = None
-                        
-                        locations = pool.get('poolLocations', [])
-                        if locations:
-                            loc = locations[0]
-                            street = loc.get('street')
-                            city = loc.get('city')
-                            zip_code = loc.get('zipCode')
-                            
-                            loc_names = loc.get('poolLocationNames', [])
-                            if loc_names:
-                                location_name = loc_names[0].get('name')
-                        
-                        # Get contact info
-                        contact_name = None
-                        contact_phone = None
-                        contacts = pool.get('poolContacts', [])
-                        if contacts:
-                            contact_name = contacts[0].get('name')
-                            contact_phone = contacts[0].get('phone')
-                        
-                        # Get max power level, plug types, and charge points by AC/DC
-                        max_power = 0
-                        plug_types = set()
-                        charge_points_by_type = {'AC': [], 'DC': []}
-                        charging_stations = pool.get('chargingStations', [])
-                        for station in charging_stations:
-                            for cp in station.get('chargePoints', []):
-                                cp_id = cp.get('dcsCpId')
-                                if not cp_id:
-                                    continue
-                                for connector in cp.get('connectors', []):
-                                    power_level = connector.get('powerLevel', 0)
-                                    if power_level and power_level > max_power:
-                                        max_power = power_level
-                                    plug_type = connector.get('plugType', '')
-                                    if plug_type:
-                                        plug_types.add(plug_type)
-                                    
-                                    # Classify by connector type first, fallback to phaseType
-                                    plug_upper = plug_type.upper()
-                                    if 'TYP2' in plug_upper or 'TYPE2' in plug_upper or 'TYPE 2' in plug_upper:
-                                        cp_type = 'AC'
-                                    elif 'CCS' in plug_upper or 'COMBO' in plug_upper:
-                                        cp_type = 'DC'
-                                    else:
-                                        # Fallback to phaseType
-                                        cp_type = connector.get('phaseType', 'AC')
-                                    
-                                    # Add to list if not already there
-                                    if cp_id not in charge_points_by_type[cp_type]:
-                                        charge_points_by_type[cp_type].append(cp_id)
-                        
-                        pool_info = {
-                            'pool_id': pool_id,
-                            'cpo_name': cpo_name,
-                            'location_name': location_name,
-                            'street': street,
-                            'city': city,
-                            'zip_code': zip_code,
-                            'contact_name': contact_name,
-                            'contact_phone': contact_phone,
-                            'max_power': max_power,
-                            'plug_types': list(plug_types),
-                            'charge_points_ac': charge_points_by_type.get('AC', []),
-                            'charge_points_dc': charge_points_by_type.get('DC', []),
-                            'cached': False,
-                            'updated_at': datetime.utcnow().isoformat()
-                        }
-                        
-                        # Save to SQLite cache
-                        station_cache.save_station(pool_id, market, pool_info)
-                        
-                        # Also cache in memory for backward compatibility
-                        pool_cache[pool_id] = pool_info
-                        results[pool_id] = pool_info
+        uncached_ids = [pid for pid in pool_ids if pid not in results]
+        
+        # Pools already being fetched by a concurrent request are not requested again
+        claimed, pending = claim_inflight([('pool', pid) for pid in uncached_ids])
+        try:
+            if claimed:
+                results.update(fetch_pools([key[1] for key in claimed], market))
+        finally:
+            release_inflight(claimed)
+        
+        # Wait for pools fetched by concurrent requests and read them from the cache
+        if pending:
+            for event in pending.values():
+                event.wait(INFLIGHT_TIMEOUT_SECONDS)
+            for pool_id, station in station_cache.get_stations([key[1] for key in pending]).items():
+                results[pool_id] = pool_info_from_cache(pool_id, station)
         
+        # Expired data is still better than nothing if the API didn't return the pool
+        for pool_id, station in cached_results.items():
+            if pool_id not in results:
+                results[pool_id] = pool_info_from_cache(pool_id, station)
+        
+        # Let the updater know which stations people look at
+        with cache_lock:
+            untouched_ids = [pid for pid in results if pid not in recently_accessed]
+            for pool_id in untouched_ids:
+                recently_accessed[pool_id] = True
+        station_cache.touch_stations(untouched_ids)
+        
+        if columnar:
+            return jsonify({
+                'fields': POOL_DETAIL_FIELDS,
+                'rows': [[pool.get(field) for field in POOL_DETAIL_FIELDS] for pool in results.values()]
+            })
         return jsonify(results)
         
     except Exception as e:
-        import traceback
-        print(f"Error in api_pool_details: {e}")
-        traceback.print_exc()
+        logger.exception("Error in api_pool_details")
         return jsonify({'error': str(e)}), 500
 
 
@@ -452,17 +827,68 @@ def api_cached_prices():
         if not pool_ids:
             return jsonify({})
         
+        pool_ids = list(dict.fromkeys(pool_ids))
+        if len(pool_ids) > MAX_CACHED_PRICE_POOLS:
+            return jsonify({'error': f'Too many pool IDs (max {MAX_CACHED_PRICE_POOLS})'}), 400
+        
         # Get all cached prices for these pools
-        all_prices = station_cache.get_all_prices_for_pools(pool_ids[:200], market)
+        all_prices = station_cache.get_all_prices_for_pools(pool_ids, market)
         
         return jsonify(all_prices)
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in api_cached_prices")
         return jsonify({'error': str(e)}), 500
 
 
+def fetch_price_batch(group, charge_points):
+    """Fetch prices for charge points sharing (market, tariff, power type, power) in one request"""
+    market, tariff_id, power_type, power = group
+    logger.info("Requesting prices for %d charge points, tariff=%s, market=%s", len(charge_points), tariff_id, market)
+    
+    response = upstream(
+        'POST', f"{market}/tariffs/{tariff_id}/prices",
+        json=[
+            {
+                "charge_point": cp,
+                "power_type": power_type,
+                "power": power
+            }
+            for cp in charge_points
+        ]
+    )
+    if not response.ok:
+        logger.warning("Price API returned %s", response.status_code)
+        return {}
+    return {item.get('price_identifier', {}).get('charge_point'): item for item in response.json()}
+
+
+def fetch_status_batch(market, charge_point_ids):
+    """Fetch the availability of several charge points in one request"""
+    response = upstream(
+        'POST', f"{market}/query",
+        json={
+            "DCSChargePointDynStatusRequest": [
+                {"dcsChargePointId": cp_id} for cp_id in charge_point_ids
+            ]
+        },
+        headers={"rest-api-path": "charge-points"}
+    )
+    response.raise_for_status()
+    return {item['dcsChargePointId']: item for item in response.json().get('DCSChargePointDynStatusResponse', [])}
+
+
+# Price and status lookups from concurrent requests are coalesced into shared
+# upstream calls (requests arriving within 30ms go out together); each call runs
+# on the upstream executor so a slow one doesn't hold up the others
+price_batcher = RequestBatcher(fetch_price_batch, window=0.03, batch_size=50, name="PriceBatcher",
+                               executor=upstream_executor)
+status_batcher = RequestBatcher(fetch_status_batch, window=0.03, batch_size=100, name="StatusBatcher",
+                                executor=upstream_executor)
+# Max seconds a request waits for its batched upstream results before answering 504
+BATCH_RESULT_TIMEOUT = float(os.environ.get('BATCH_RESULT_TIMEOUT', 30))
+
+
 @app.route('/api/prices', methods=['POST'])
 def api_prices():
     """Get prices for multiple charge points.
@@ -480,23 +906,30 @@ def api_prices():
         if not charge_points:
             return jsonify({'error': 'No charge points provided'}), 400
         
+        # Drop duplicate charge points, keeping each one paired with its pool ID
+        seen = set()
+        requested = []
+        for i, cp in enumerate(charge_points):
+            if cp not in seen:
+                seen.add(cp)
+                requested.append((cp, pool_ids[i] if i < len(pool_ids) else None))
+        
         # Limit batch size to avoid rate limiting
-        charge_points = charge_points[:10]
-        pool_ids = pool_ids[:10] if pool_ids else []
+        if len(requested) > MAX_PRICE_CHARGE_POINTS:
+            return jsonify({'error': f'Too many charge points (max {MAX_PRICE_CHARGE_POINTS})'}), 400
         
         # Check SQLite cache first for cached prices
         cached_prices = {}
-        if pool_ids:
-            cached_prices = station_cache.get_prices(pool_ids, tariff_id, power_type, market)
+        cached_pool_ids = [pool_id for _, pool_id in requested if pool_id]
+        if cached_pool_ids:
+            cached_prices = station_cache.get_prices(cached_pool_ids, tariff_id, power_type, market)
         
         # Build result list
         prices = []
         uncached_cps = []
         uncached_pool_map = {}  # charge_point -> pool_id
         
-        for i, cp in enumerate(charge_points):
-            pool_id = pool_ids[i] if i < len(pool_ids) else None
-            
+        for cp, pool_id in requested:
             # Check if we have a cached price for this pool
             if pool_id and pool_id in cached_prices:
                 cached = cached_prices[pool_id]
@@ -517,92 +950,55 @@ def api_prices():
                 if pool_id:
                     uncached_pool_map[cp] = pool_id
         
-        # Fetch uncached prices from API
-        if uncached_cps:
-            print(f"Requesting prices for {len(uncached_cps)} charge points, tariff={tariff_id}, market={market}")
+        # Fetch uncached prices from API (batched with other requests for the same tariff)
+        group = (market, tariff_id, power_type, power)
+        futures = [(cp, price_batcher.submit(cp, group)) for cp in uncached_cps]
+        deadline = time.monotonic() + BATCH_RESULT_TIMEOUT
+        new_prices = []
+        for cp, future in futures:
+            item = future.result(timeout=max(0, deadline - time.monotonic()))
+            if item is None:
+                # Return empty prices for items the API didn't price
+                prices.append({
+                    'charge_point': cp,
+                    'power_type': power_type,
+                    'power': power,
+                    'currency': 'EUR',
+                    'energy_price': None,
+                    'session_fee': None,
+                    'blocking_fee': None,
+                    'blocking_after_minutes': None,
+                    'cached': False
+                })
+                continue
             
-            temp_session = create_api_session()
-            payload = [
-                {
-                    "charge_point": cp,
-                    "power_type": power_type,
-                    "power": power
-                }
-                for cp in uncached_cps
-            ]
+            fees = parse_price_components(item)
+            price_data = {
+                'charge_point': cp,
+                'power_type': item.get('price_identifier', {}).get('power_type', power_type),
+                'power': item.get('price_identifier', {}).get('power', power),
+                'currency': item.get('currency', 'EUR'),
+                **fees,
+                'cached': False,
+                'updated_at': datetime.utcnow().isoformat()
+            }
             
-            response = temp_session.post(
-                f"{BASE_URL}/{market}/tariffs/{tariff_id}/prices",
-                json=payload
-            )
+            prices.append(price_data)
             
-            if not response.ok:
-                print(f"API Error: {response.status_code}")
-                # Return empty prices for uncached items
-                for cp in uncached_cps:
-                    prices.append({
-                        'charge_point': cp,
-                        'power_type': power_type,
-                        'power': power,
-                        'currency': 'EUR',
-                        'energy_price': None,
-                        'session_fee': None,
-                        'blocking_fee': None,
-                        'blocking_after_minutes': None,
-                        'cached': False
-                    })
-            else:
-                # Parse and save response
-                response_data = response.json()
-                
-                for item in response_data:
-                    energy_price = None
-                    session_fee = None
-                    blocking_fee = None
-                    blocking_after = None
-                    currency = item.get('currency', 'EUR')
-                    
-                    for element in item.get('elements', []):
-                        for component in element.get('price_components', []):
-                            if component['type'] == 'ENERGY':
-                                energy_price = component['price']
-                            elif component['type'] == 'FLAT':
-                                session_fee = component['price']
-                            elif component['type'] == 'TIME':
-                                blocking_fee = component['price']
-                                min_duration = element.get('restrictions', {}).get('min_duration')
-                                if min_duration:
-                                    blocking_after = min_duration // 60
-                    
-                    cp_id = item.get('price_identifier', {}).get('charge_point', '')
-                    
-                    price_data = {
-                        'charge_point': cp_id,
-                        'power_type': item.get('price_identifier', {}).get('power_type', power_type),
-                        'power': item.get('price_identifier', {}).get('power', power),
-                        'currency': currency,
-                        'energy_price': energy_price,
-                        'session_fee': session_fee,
-                        'blocking_fee': blocking_fee,
-                        'blocking_after_minutes': blocking_after,
-                        'cached': False,
-                        'updated_at': datetime.utcnow().isoformat()
-                    }
-                    
-                    prices.append(price_data)
-                    
-                    # Save to SQLite cache if we have the pool ID
-                    pool_id = uncached_pool_map.get(cp_id)
-                    if pool_id and energy_price is not None:
-                        station_cache.save_price(
-                            pool_id, cp_id, tariff_id, power_type, power, market, price_data
-                        )
+            # Save to SQLite cache if we have the pool ID
+            pool_id = uncached_pool_map.get(cp)
+            if pool_id and fees['energy_price'] is not None:
+                new_prices.append((pool_id, cp, tariff_id, power_type, power, market, price_data))
+        
+        # One transaction for all new prices
+        station_cache.save_prices_bulk(new_prices)
         
         return jsonify(prices)
+    except TimeoutError:
+        logger.warning("Timed out waiting for batched price lookups")
+        return jsonify({'error': 'Upstream price lookup timed out'}), 504
     except Exception as e:
-        import traceback
-        print(f"Error in api_prices: {e}")
-        traceback.print_exc()
+        logger.exception("Error in api_prices")
         return jsonify({'error': str(e)}), 500
 
 
@@ -616,29 +1012,21 @@ def api_status():
         if not charge_point_ids:
             return jsonify({'error': 'No charge point IDs provided'}), 400
         
-        payload = {
-            "DCSChargePointDynStatusRequest": [
-                {"dcsChargePointId": cp_id} for cp_id in charge_point_ids
-            ]
-        }
-        
-        temp_session = create_api_session()
-        response = temp_session.post(
-            f"{BASE_URL}/{DEFAULT_MARKET}/query",
-            json=payload,
-            headers={"rest-api-path": "charge-points"}
-        )
-        response.raise_for_status()
-        
-        result = response.json()
+        # Batched with concurrent status requests into shared upstream queries
+        futures = [(cp_id, status_batcher.submit(cp_id, DEFAULT_MARKET)) for cp_id in dict.fromkeys(charge_point_ids)]
+        deadline = time.monotonic() + BATCH_RESULT_TIMEOUT
         statuses = {}
-        for item in result.get('DCSChargePointDynStatusResponse', []):
-            statuses[item['dcsChargePointId']] = {
-                'status': item.get('OperationalStateCP', 'UNKNOWN'),
-                'timestamp': item.get('Timestamp')
-            }
+        for cp_id, future in futures:
+            item = future.result(timeout=max(0, deadline - time.monotonic()))
+            if item is not None:
+                statuses[cp_id] = {
+                    'status': item.get('OperationalStateCP', 'UNKNOWN'),
+                    'timestamp': item.get('Timestamp')
+                }
         
         return jsonify(statuses)
+    except TimeoutError:
+        return jsonify({'error': 'Upstream status lookup timed out'}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -685,7 +1073,7 @@ def api_cache_refresh():
         
         # Force update the station
         try:
-            updated_station = background_updater.force_update(pool_id, market)
+            updated_station = background_updater.force_update(pool_id, market, timeout=BATCH_RESULT_TIMEOUT)
             
             # Also get updated prices
             updated_prices = {}
@@ -703,6 +1091,12 @@ def api_cache_refresh():
                 'message': 'Station data refreshed successfully'
             })
             
+        except TimeoutError:
+            return jsonify({
+                'success': False,
+                'error': 'Station refresh timed out',
+                'message': 'The refresh is still running; try again shortly'
+            }), 504
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -711,9 +1105,7 @@ def api_cache_refresh():
             }), 429 if 'rate limit' in str(e).lower() else 500
         
     except Exception as e:
-        import traceback
-        print(f"Error in api_cache_refresh: {e}")
-        traceback.print_exc()
+        logger.exception("Error in api_cache_refresh")
         return jsonify({'error': str(e)}), 500
 
 
@@ -745,12 +1137,6 @@ def api_cache_queue():
 
 
 if __name__ == '__main__':
-    # Create templates and static directories if they don't exist
-    os.makedirs('templates', exist_ok=True)
-    os.makedirs('static', exist_ok=True)
-    os.makedirs('static/css', exist_ok=True)
-    os.makedirs('static/js', exist_ok=True)
-    
     print("=" * 60)
     print("ChargeMyHyundai Price Map")
     print("=" * 60)
@@ -766,4 +1152,5 @@ if __name__ == '__main__':
     
     print("=" * 60)
     
-    app.run(debug=True, port=5000, use_reloader=False)  # Disable reloader to prevent double background threads
+    # Debug mode is opt-in (FLASK_DEBUG=1); disable reloader to prevent double background threads
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=5000, use_reloader=False)
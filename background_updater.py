@@ -5,18 +5,225 @@ This module provides automatic background updates for cached charging station da
 It respects rate limits and runs continuously to keep the cache fresh.
 """
 
+import heapq
+import os
 import threading
 import time
 import logging
-from datetime import datetime, timedelta
-from typing import Callable, Optional, Dict, Any, List
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Dict, Any, Iterable, Iterator, List, Tuple, Union
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from station_cache import get_cache, CACHE_EXPIRY_HOURS
+from station_cache import get_cache, parse_pool, CACHE_EXPIRY_HOURS, STALE_AFTER_HOURS, RATE_LIMIT_REQUESTS
+from chargemyhyundai_api import parse_price_components
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Library-style logging: the application decides where records go (app.py sets up
+# the root logger); the NullHandler just keeps Python's last-resort handler quiet
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Manual refreshes arriving within this window are fetched in one upstream query;
+# queued and manual refreshes fetch the details of up to this many pools at once
+REFRESH_BATCH_WINDOW_SECONDS = 0.025
+REFRESH_BATCH_SIZE = 20
+
+# Concurrent price requests per station: enough to use a full rate limit window at
+# once, more would only wait for slots (and stays below the session's pool size)
+PRICE_FETCH_WORKERS = RATE_LIMIT_REQUESTS
+
+# Stations that failed to refresh are tried again after this long
+REFRESH_RETRY_SECONDS = 3600
+
+# Stations read in every hour since their last update are refreshed this often; the
+# less they are read, the closer their refresh moves to STALE_AFTER_HOURS, and
+# stations nobody read are only refreshed when they expire
+MIN_REFRESH_HOURS = 2
+
+# How often the refresh schedule picks up stations saved by other processes
+SCHEDULE_SYNC_SECONDS = 60
+
+# How long a manual refresh waits for an update of the same station already running
+UPDATE_WAIT_TIMEOUT_SECONDS = 60
+
+# Per-endpoint request headers, shared by every call (never mutate)
+POOLS_QUERY_HEADERS = {"rest-api-path": "pools"}
+
+
+def timestamp_to_epoch(value: str) -> float:
+    """Convert a UTC timestamp as stored in the cache to seconds since the epoch"""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def refresh_interval_hours(access_count: int, age_hours: float) -> float:
+    """How long after its last update a station should be refreshed, given how often it was read since"""
+    if not access_count:
+        return CACHE_EXPIRY_HOURS
+    
+    # Accesses are recorded at most hourly, so this is the share of hours with readers
+    access_rate = min(1.0, access_count / max(age_hours, 1.0))
+    return STALE_AFTER_HOURS - (STALE_AFTER_HOURS - MIN_REFRESH_HOURS) * access_rate
+
+
+class RequestBatcher:
+    """
+    Coalesces concurrent requests for upstream data into micro-batches.
+    
+    submit(key, group) returns a Future; a worker thread collects everything submitted
+    within a short window and calls handler(group, keys) once per group (e.g. market).
+    The handler returns {key: result or Exception}, which resolves the futures; keys
+    missing from it resolve to None. A handler may instead yield (key, result) pairs to
+    resolve each future as soon as its result is ready. With an executor, each group's
+    handler call runs on it, so one slow group doesn't hold up the others.
+    """
+    
+    def __init__(self, handler: Callable[[Any, List[Any]], Union[Dict[Any, Any], Iterable[Tuple[Any, Any]]]],
+                 window: float = REFRESH_BATCH_WINDOW_SECONDS,
+                 batch_size: int = REFRESH_BATCH_SIZE,
+                 name: str = "RequestBatcher",
+                 executor: Optional[Executor] = None):
+        self._handler = handler
+        self._executor = executor
+        self._window = window
+        self._batch_size = batch_size
+        self._name = name
+        self._pending: Dict[Tuple[Any, Any], Future] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+    
+    def submit(self, key: Any, group: Any) -> Future:
+        """Queue a request; requests for a key that is already pending share its Future"""
+        with self._condition:
+            future = self._pending.get((key, group))
+            if future is None:
+                future = self._pending[(key, group)] = Future()
+                self._condition.notify()
+            
+            # The worker is started lazily so batching works without the update loop
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.name = self._name
+                self._thread.start()
+            return future
+    
+    def _run(self):
+        """Worker loop: wait for requests, let the batch fill up, then dispatch it"""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            
+            # Give concurrent requests a moment to join the batch
+            time.sleep(self._window)
+            
+            with self._condition:
+                pending_keys = list(self._pending)[:self._batch_size]
+                batch = {pending_key: self._pending.pop(pending_key) for pending_key in pending_keys}
+            
+            by_group: Dict[Any, Dict[Any, Future]] = {}
+            for (key, group), future in batch.items():
+                by_group.setdefault(group, {})[key] = future
+            
+            for group, futures in by_group.items():
+                if self._executor is None:
+                    self._dispatch(group, futures)
+                else:
+                    self._executor.submit(self._dispatch, group, futures)
+    
+    def _dispatch(self, group: Any, futures: Dict[Any, Future]):
+        """Call the handler for one group and resolve its futures"""
+        try:
+            results = self._handler(group, list(futures))
+            for key, result in results.items() if isinstance(results, dict) else results:
+                future = futures.get(key)
+                if future is None or future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for future in futures.values():
+            if not future.done():
+                future.set_result(None)
+
+
+class RefreshScheduler:
+    """
+    Min-heap of cached stations ordered by when they are next due for a refresh.
+    
+    Rescheduling or removing a station leaves its old heap entry behind; such
+    outdated entries are skipped when they reach the top.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, str]] = []
+        self._entries: Dict[str, Tuple[float, str]] = {}  # pool_id -> (due_at, market)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def schedule(self, pool_id: str, market: str, due_at: float):
+        """(Re)schedule a station's next refresh at due_at (seconds since the epoch)"""
+        with self._lock:
+            self._entries[pool_id] = (due_at, market)
+            heapq.heappush(self._heap, (due_at, pool_id))
+            
+            # Drop outdated entries once they make up most of the heap
+            if len(self._heap) > 2 * len(self._entries) + 1024:
+                self._heap = [(due, pid) for pid, (due, _) in self._entries.items()]
+                heapq.heapify(self._heap)
+    
+    def unschedule(self, pool_id: str):
+        """Stop refreshing a station"""
+        with self._lock:
+            self._entries.pop(pool_id, None)
+    
+    def entries(self) -> List[Tuple[str, str, float]]:
+        """All scheduled stations as (pool_id, market, due_at)"""
+        with self._lock:
+            return [(pool_id, market, due_at) for pool_id, (due_at, market) in self._entries.items()]
+    
+    def load(self, entries: List[Tuple[str, str, float]]):
+        """Schedule many stations at once (as returned by entries())"""
+        with self._lock:
+            for pool_id, market, due_at in entries:
+                self._entries[pool_id] = (due_at, market)
+            self._heap = [(due_at, pool_id) for pool_id, (due_at, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+    
+    def pop_due(self, now: float, limit: int) -> List[Tuple[str, str]]:
+        """Remove and return up to limit (pool_id, market) pairs due at or before now"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                due_at, pool_id = heapq.heappop(self._heap)
+                entry = self._entries.get(pool_id)
+                if entry is None or entry[0] != due_at:
+                    continue  # Rescheduled or removed since this entry was pushed
+                del self._entries[pool_id]
+                due.append((pool_id, entry[1]))
+        return due
+    
+    def next_due(self) -> Optional[float]:
+        """When the next station is due (seconds since the epoch), None if nothing is scheduled"""
+        with self._lock:
+            while self._heap:
+                due_at, pool_id = self._heap[0]
+                entry = self._entries.get(pool_id)
+                if entry is not None and entry[0] == due_at:
+                    return due_at
+                heapq.heappop(self._heap)
+        return None
 
 
 class BackgroundUpdater:
@@ -26,7 +233,8 @@ class BackgroundUpdater:
                  session: requests.Session,
                  base_url: str = "https://chargemyhyundai.com/api/map/v1",
                  default_market: str = "de",
-                 default_tariffs: List[str] = None):
+                 default_tariffs: List[str] = None,
+                 snapshot_path: Optional[str] = None):
         """
         Initialize the background updater.
         
@@ -35,11 +243,14 @@ class BackgroundUpdater:
             base_url: ChargeMyHyundai API base URL
             default_market: Default market code
             default_tariffs: List of tariff IDs to update prices for
+            snapshot_path: Optional file to save the refresh schedule to on stop, so
+                the next start doesn't have to rebuild it from every cached station
         """
         self.cache = get_cache()
         self.base_url = base_url
         self.default_market = default_market
         self.default_tariffs = default_tariffs or ['HYUNDAI_FLEX', 'HYUNDAI_SMART']
+        self.snapshot_path = snapshot_path
         
         # Threading control
         self._thread: Optional[threading.Thread] = None
@@ -47,13 +258,51 @@ class BackgroundUpdater:
         self._running = False
         
         # Update tracking
-        self._last_update_time: Optional[datetime] = None
+        self._last_update_time: Optional[float] = None  # time.time() of the last update
         self._updates_today = 0
         self._errors_today = 0
+        self._stats_day = int(time.time() // 86400)  # UTC day the counters belong to
+        
+        # Manual refreshes are batched into shared upstream queries
+        self._refresh_batcher = RequestBatcher(self._refresh_batch, name="RefreshBatcher")
+        
+        # Stations being updated right now (by the loop or a manual refresh), so
+        # the same station is never fetched twice at once
+        self._updating: Dict[str, threading.Event] = {}
+        self._updating_lock = threading.Lock()
+        
+        # When each cached station is due for a refresh, kept in sync incrementally
+        # with the stations table (see _sync_schedule)
+        self._scheduler = RefreshScheduler()
+        self._synced_until = ''
+        self._next_sync = 0.0
+        
+        # One long-lived session so API calls reuse keep-alive connections
+        self._session = self._create_session()
+        
+        # A station's tariff prices are fetched in parallel (still within the rate limit);
+        # shared by the update loop and manual refreshes, so it lives as long as the updater
+        self._price_executor = ThreadPoolExecutor(
+            max_workers=PRICE_FETCH_WORKERS, thread_name_prefix="PriceFetcher"
+        )
     
     def _create_session(self) -> requests.Session:
-        """Create a fresh session with proper headers for API calls"""
+        """Create a session with proper headers and retrying, pooled connections for API calls"""
         s = requests.Session()
+        # Same retry policy as the app's session: only gateway errors are retried here,
+        # so every request that reaches the API went through the rate limiter
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=frozenset(['GET', 'POST']),
+                raise_on_status=False
+            )
+        )
+        s.mount('https://', adapter)
         s.headers.update({
             'Content-Type': 'application/json',
             'Accept': 'application/json, text/plain, */*',
@@ -84,25 +333,51 @@ class BackgroundUpdater:
         logger.info("Stopping background updater...")
         self._stop_event.set()
         self._running = False
+        self.cache.wake_queue_waiters()
         
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=10)
         
+        self._save_snapshot()
         logger.info("Background updater stopped")
     
     def is_running(self) -> bool:
         """Check if the updater is running"""
         return self._running and self._thread and self._thread.is_alive()
     
+    def _roll_over_day(self):
+        """Reset the daily counters once a new (UTC) day has started"""
+        day = int(time.time() // 86400)
+        if day != self._stats_day:
+            self._stats_day = day
+            self._updates_today = 0
+            self._errors_today = 0
+    
+    def _record_update(self):
+        """Count a successful station update"""
+        self._roll_over_day()
+        self._updates_today += 1
+        self._last_update_time = time.time()
+    
+    def _record_error(self):
+        """Count a failed update"""
+        self._roll_over_day()
+        self._errors_today += 1
+    
     def get_status(self) -> Dict[str, Any]:
         """Get current updater status"""
+        self._roll_over_day()
         cache_stats = self.cache.get_stats()
         return {
             'running': self.is_running(),
-            'last_update': self._last_update_time.isoformat() if self._last_update_time else None,
+            'last_update': (
+                datetime.fromtimestamp(self._last_update_time, timezone.utc).replace(tzinfo=None).isoformat()
+                if self._last_update_time else None
+            ),
             'updates_today': self._updates_today,
             'errors_today': self._errors_today,
             'queue_size': cache_stats['queue_size'],
+            'scheduled_stations': len(self._scheduler),
             'stale_stations': cache_stats['stale_stations'],
             'total_cached_stations': cache_stats['total_stations'],
             'fresh_stations': cache_stats['fresh_stations']
@@ -115,306 +390,391 @@ class BackgroundUpdater:
         # Wait a bit before starting to let the app initialize
         time.sleep(5)
         
+        if not self._synced_until:
+            self._load_snapshot()
+        
         while not self._stop_event.is_set():
             try:
-                # First, queue any stale stations that need updating
-                self._queue_stale_stations()
+                # First, queue any stations that are due for a refresh
+                self._queue_due_stations()
                 
                 # Process update queue
-                updated = self._process_queue_item()
+                updated = self._process_queue_batch()
                 
                 if not updated:
-                    # No items to update, wait before checking again
-                    self._stop_event.wait(timeout=60)  # Wait 1 minute
+                    # No items to update, sleep until something is queued or the
+                    # next station is due
+                    self.cache.wait_for_queue(timeout=self._seconds_until_due())
                 
             except Exception as e:
-                logger.error(f"Error in update loop: {e}", exc_info=True)
-                self._errors_today += 1
+                logger.error("Error in update loop: %s", e, exc_info=True)
+                self._record_error()
                 # Wait a bit before retrying after error
                 self._stop_event.wait(timeout=30)
         
+        self.cache.close()
         logger.info("Update loop ended")
     
-    def _queue_stale_stations(self):
-        """Add stale stations to the update queue"""
-        stale_ids = self.cache.get_stale_stations(limit=50)
+    def _save_snapshot(self):
+        """Write the refresh schedule to snapshot_path (if configured)"""
+        if not self.snapshot_path or not self._synced_until:
+            return
         
-        for pool_id in stale_ids:
-            station = self.cache.get_station(pool_id)
-            if station:
-                market = station.get('market', self.default_market)
-                # Lower priority for automatic background updates
-                self.cache.queue_update(pool_id, market, priority=1)
+        try:
+            # Write to a temporary file first so a crash never leaves half a snapshot
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps({
+                    'db_path': os.path.abspath(self.cache.db_path),
+                    'synced_until': self._synced_until,
+                    'entries': self._scheduler.entries()
+                }))
+            os.replace(tmp_path, self.snapshot_path)
+            logger.info("Saved refresh schedule of %d stations", len(self._scheduler))
+        except Exception as e:
+            logger.warning("Could not save refresh schedule snapshot: %s", e)
     
-    def _process_queue_item(self) -> bool:
+    def _load_snapshot(self):
         """
-        Process one item from the update queue.
-        Returns True if an item was processed, False if queue is empty.
+        Restore the refresh schedule saved by _save_snapshot(), so the first sync
+        only reads stations updated since; everything written after the snapshot
+        is picked up by that sync. Snapshots taken from another database are ignored.
         """
-        # Check rate limit
-        self.cache.wait_for_rate_limit()
-        
-        # Get next item from queue
-        item = self.cache.get_next_update()
-        if not item:
-            return False
-        
-        pool_id, market = item
-        start_time = time.time()
-        success = False
-        error_msg = None
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
         
         try:
-            # Fetch fresh data from API
-            self._update_station(pool_id, market)
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = orjson.loads(f.read())
+            if snapshot['db_path'] != os.path.abspath(self.cache.db_path):
+                return
             
-            # Record the request for rate limiting
-            self.cache.record_request()
+            self._scheduler.load(snapshot['entries'])
+            self._synced_until = snapshot['synced_until']
+            logger.info("Loaded refresh schedule of %d stations", len(self._scheduler))
+        except Exception as e:
+            logger.warning("Could not load refresh schedule snapshot: %s", e)
+    
+    def _sync_schedule(self):
+        """Schedule stations saved since the last sync (by any process) for their first refresh check"""
+        for pool_id, market, updated_at in self.cache.get_refresh_times(self._synced_until):
+            self._scheduler.schedule(
+                pool_id, market, timestamp_to_epoch(updated_at) + MIN_REFRESH_HOURS * 3600
+            )
+            self._synced_until = updated_at
+    
+    def _seconds_until_due(self) -> float:
+        """How long the loop can sleep: until the next station is due or the next schedule sync"""
+        timeout = self._next_sync - time.monotonic()
+        next_due = self._scheduler.next_due()
+        if next_due is not None:
+            timeout = min(timeout, next_due - time.time())
+        return max(timeout, 0.0)
+    
+    def _queue_due_stations(self):
+        """
+        Add stations due for a refresh to the update queue. Each station's refresh
+        interval follows how often clients read it (see refresh_interval_hours) and
+        is re-checked every MIN_REFRESH_HOURS until the station is due.
+        """
+        if time.monotonic() >= self._next_sync:
+            self._sync_schedule()
+            self._next_sync = time.monotonic() + SCHEDULE_SYNC_SECONDS
+        
+        now = time.time()
+        due = self._scheduler.pop_due(now, limit=50)
+        refresh_info = self.cache.get_refresh_info([pool_id for pool_id, _ in due])
+        to_queue = []
+        for pool_id, market in due:
+            info = refresh_info.get(pool_id)
+            if info is None:
+                continue  # No longer cached
             
-            success = True
-            self._updates_today += 1
-            self._last_update_time = datetime.utcnow()
+            updated_at, access_count = info
+            updated = timestamp_to_epoch(updated_at)
+            due_at = updated + refresh_interval_hours(access_count, (now - updated) / 3600) * 3600
             
-        except Exception as e:
-            error_msg = str(e)
-            logger.warning(f"Failed to update station {pool_id}: {e}")
-            self._errors_today += 1
+            if due_at > now:
+                # Check again in a while, the station may get busier until then
+                self._scheduler.schedule(pool_id, market, min(due_at, now + MIN_REFRESH_HOURS * 3600))
+            else:
+                # Lower priority for automatic background updates
+                to_queue.append((pool_id, market, 1))
         
+        self.cache.queue_updates_bulk(to_queue)
+    
+    def _process_queue_batch(self) -> bool:
+        """
+        Process the next batch of queued stations (up to REFRESH_BATCH_SIZE, all from
+        one market), fetching their pool details in a single request.
+        Returns True if anything was processed, False if queue is empty.
+        """
+        items = self.cache.claim_next_updates(REFRESH_BATCH_SIZE)
+        if not items:
+            return False
+        
+        market = items[0][1]
+        
+        # Stations a manual refresh is updating right now are simply dropped from the queue
+        pool_ids, _ = self._claim_updates([pool_id for pool_id, _ in items])
+        
+        try:
+            if pool_ids:
+                self._update_queued_stations(market, pool_ids)
         finally:
-            # Remove from queue regardless of success
-            self.cache.remove_from_queue(pool_id)
-            
-            # Log the update attempt
-            duration_ms = int((time.time() - start_time) * 1000)
-            self.cache.log_update(pool_id, 'full', success, error_msg, duration_ms)
+            self._release_updates(pool_ids)
         
         return True
     
-    def _update_station(self, pool_id: str, market: str):
-        """Fetch and update a single station's data"""
-        # Fetch pool details
-        pool_data = self._fetch_pool_details(pool_id, market)
+    def _update_queued_stations(self, market: str, pool_ids: List[str]):
+        """Update queued stations of one market, fetching their pool details in one request"""
+        start_time = time.monotonic()
         
-        if pool_data:
-            # Save station data
-            self.cache.save_station(pool_id, market, pool_data)
-            
-            # Get charge point IDs for price fetching
-            ac_cps = pool_data.get('charge_points_ac', [])
-            dc_cps = pool_data.get('charge_points_dc', [])
+        # Fetch fresh pool details for the whole batch from the API
+        self.cache.reserve_request()
+        pools = self._fetch_pools_details(pool_ids, market)
+        pools = {pool_id: pools[pool_id] for pool_id in pool_ids if pool_id in pools}
+        
+        # Save the stations and their prices
+        batch_error = None
+        try:
+            self._update_stations(market, pools)
+        except Exception as e:
+            batch_error = str(e)
+        
+        duration_ms = int((time.monotonic() - start_time) * 1000)
+        log_entries = []
+        for pool_id in pool_ids:
+            error_msg = batch_error or (None if pool_id in pools else "No pool details returned")
+            if error_msg:
+                logger.warning("Failed to update station %s: %s", pool_id, error_msg)
+                self._record_error()
+            else:
+                self._record_update()
             
-            # Fetch prices for each tariff
-            for tariff_id in self.default_tariffs:
-                # Wait for rate limit before each price request
-                self.cache.wait_for_rate_limit()
-                
-                # AC prices
-                if ac_cps:
-                    self._fetch_and_save_price(
-                        pool_id, ac_cps[0], tariff_id, 'AC', 11, market
-                    )
-                    self.cache.record_request()
-                
-                # Wait between AC and DC requests
-                self.cache.wait_for_rate_limit()
-                
-                # DC prices  
-                if dc_cps:
-                    self._fetch_and_save_price(
-                        pool_id, dc_cps[0], tariff_id, 'DC', 50, market
-                    )
-                    self.cache.record_request()
+            # Try again later if the station wasn't actually refreshed; otherwise
+            # the next schedule sync replaces this with its regular refresh time
+            self._scheduler.schedule(pool_id, market, time.time() + REFRESH_RETRY_SECONDS)
+            log_entries.append((pool_id, 'full', error_msg is None, error_msg, duration_ms))
+        
+        # Log the update attempts
+        self.cache.log_updates_bulk(log_entries)
+    
+    def _claim_updates(self, pool_ids: List[str]) -> Tuple[List[str], Dict[str, threading.Event]]:
+        """
+        Claim the update of each station unless another thread is already updating it.
+        Returns (claimed, updating): the stations this caller has to update itself and
+        a {pool_id: event} dict for stations another thread is updating right now.
+        """
+        claimed = []
+        updating = {}
+        with self._updating_lock:
+            for pool_id in pool_ids:
+                event = self._updating.get(pool_id)
+                if event is None:
+                    self._updating[pool_id] = threading.Event()
+                    claimed.append(pool_id)
+                else:
+                    updating[pool_id] = event
+        return claimed, updating
+    
+    def _release_updates(self, pool_ids: List[str]):
+        """Release claimed stations and wake up everyone waiting for them"""
+        with self._updating_lock:
+            events = [self._updating.pop(pool_id) for pool_id in pool_ids if pool_id in self._updating]
+        for event in events:
+            event.set()
+    
+    def _update_stations(self, market: str, pools: Dict[str, Dict[str, Any]]):
+        """Save fetched pool details and refresh the stations' prices, one transaction each for the batch"""
+        if not pools:
+            return
+        
+        # Save station data
+        self.cache.save_stations_bulk(market, list(pools.values()))
+        
+        futures = [
+            future
+            for pool_id, pool_data in pools.items()
+            for future in self._submit_price_fetches(pool_id, market, pool_data)
+        ]
+        wait(futures)
+        
+        self.cache.save_prices_bulk([future.result() for future in futures if future.result()])
+    
+    def _submit_price_fetches(self, pool_id: str, market: str, pool_data: Dict[str, Any]) -> List[Future]:
+        """
+        Start fetching a station's AC and DC prices for each tariff in parallel, each
+        request claiming its own rate limit slot. The futures resolve to
+        cache.save_prices_bulk() rows (or None).
+        """
+        return [
+            self._price_executor.submit(
+                self._fetch_price_rate_limited,
+                pool_id, charge_points[0], tariff_id, power_type, power, market
+            )
+            for tariff_id in self.default_tariffs
+            for charge_points, power_type, power in (
+                (pool_data.get('charge_points_ac', []), 'AC', 11),
+                (pool_data.get('charge_points_dc', []), 'DC', 50)
+            )
+            if charge_points
+        ]
     
     def _fetch_pool_details(self, pool_id: str, market: str) -> Optional[Dict[str, Any]]:
         """Fetch pool details from API"""
+        return self._fetch_pools_details([pool_id], market).get(pool_id)
+    
+    def _fetch_pools_details(self, pool_ids: List[str], market: str) -> Dict[str, Dict[str, Any]]:
+        """Fetch details for several pools in one API request, keyed by pool ID"""
         try:
-            session = self._create_session()
-            response = session.post(
+            # Bodies are serialized with orjson; the session already sends the JSON content type
+            response = self._session.post(
                 f"{self.base_url}/{market}/query",
-                json={"dcsPoolIds": [pool_id]},
-                headers={"rest-api-path": "pools"},
+                data=orjson.dumps({"dcsPoolIds": pool_ids}),
+                headers=POOLS_QUERY_HEADERS,
                 timeout=30
             )
             
             if not response.ok:
-                logger.warning(f"Pool details API returned {response.status_code}")
-                return None
-            
-            pools_data = response.json()
-            if not pools_data:
-                return None
-            
-            pool = pools_data[0]
+                logger.warning("Pool details API returned %s", response.status_code)
+                return {}
             
-            # Extract useful information
-            cpo_name = pool.get('technicalChargePointOperatorName', 'Unbekannt')
-            
-            # Get location details
-            location_name = None
-            street = None
-            city = None
-            zip_code = None
-            
-            locations = pool.get('poolLocations', [])
-            if locations:
-                loc = locations[0]
-                street = loc.get('street')
-                city = loc.get('city')
-                zip_code = loc.get('zipCode')
-                
-                loc_names = loc.get('poolLocationNames', [])
-                if loc_names:
-                    location_name = loc_names[0].get('name')
-            
-            # Get max power level, plug types, and charge points by AC/DC
-            max_power = 0
-            plug_types = set()
-            charge_points_by_type = {'AC': [], 'DC': []}
-            
-            charging_stations = pool.get('chargingStations', [])
-            for station in charging_stations:
-                for cp in station.get('chargePoints', []):
-                    cp_id = cp.get('dcsCpId')
-                    if not cp_id:
-                        continue
-                    for connector in cp.get('connectors', []):
-                        power_level = connector.get('powerLevel', 0)
-                        if power_level and power_level > max_power:
-                            max_power = power_level
-                        plug_type = connector.get('plugType', '')
-                        if plug_type:
-                            plug_types.add(plug_type)
-                        
-                        # Classify by connector type
-                        plug_upper = plug_type.upper()
-                        if 'TYP2' in plug_upper or 'TYPE2' in plug_upper:
-                            cp_type = 'AC'
-                        elif 'CCS' in plug_upper or 'COMBO' in plug_upper:
-                            cp_type = 'DC'
-                        else:
-                            cp_type = connector.get('phaseType', 'AC')
-                        
-                        if cp_id not in charge_points_by_type[cp_type]:
-                            charge_points_by_type[cp_type].append(cp_id)
-            
-            return {
-                'pool_id': pool_id,
-                'cpo_name': cpo_name,
-                'location_name': location_name,
-                'street': street,
-                'city': city,
-                'zip_code': zip_code,
-                'max_power': max_power,
-                'plug_types': list(plug_types),
-                'charge_points_ac': charge_points_by_type.get('AC', []),
-                'charge_points_dc': charge_points_by_type.get('DC', [])
-            }
+            pools = (parse_pool(pool) for pool in orjson.loads(response.content) or [])
+            return {pool['pool_id']: pool for pool in pools if pool['pool_id']}
             
         except Exception as e:
-            logger.error(f"Error fetching pool details for {pool_id}: {e}")
-            return None
+            logger.error("Error fetching pool details for %s: %s", ', '.join(pool_ids), e)
+            return {}
+    
+    def _fetch_price_rate_limited(self, *args) -> Optional[Tuple]:
+        """Wait for a rate limit slot, then fetch a price"""
+        self.cache.reserve_request()
+        return self._fetch_price(*args)
     
-    def _fetch_and_save_price(self, pool_id: str, charge_point_id: str,
-                              tariff_id: str, power_type: str, power: int,
-                              market: str):
-        """Fetch and save price data for a charge point"""
+    def _fetch_price(self, pool_id: str, charge_point_id: str,
+                     tariff_id: str, power_type: str, power: int,
+                     market: str) -> Optional[Tuple]:
+        """
+        Fetch price data for a charge point. Returns the cache.save_prices_bulk()
+        row for it, or None if the API had no price.
+        """
         try:
-            payload = [{
+            payload = orjson.dumps([{
                 "charge_point": charge_point_id,
                 "power_type": power_type,
                 "power": power
-            }]
+            }])
             
-            session = self._create_session()
-            response = session.post(
+            response = self._session.post(
                 f"{self.base_url}/{market}/tariffs/{tariff_id}/prices",
-                json=payload,
+                data=payload,
                 timeout=30
             )
             
             if not response.ok:
-                logger.warning(f"Price API returned {response.status_code}")
-                return
+                logger.warning("Price API returned %s", response.status_code)
+                return None
             
             response_data = response.json()
             if not response_data:
-                return
+                return None
             
             item = response_data[0]
             
-            # Parse price components
-            energy_price = None
-            session_fee = None
-            blocking_fee = None
-            blocking_after = None
-            currency = item.get('currency', 'EUR')
-            
-            for element in item.get('elements', []):
-                for component in element.get('price_components', []):
-                    if component['type'] == 'ENERGY':
-                        energy_price = component['price']
-                    elif component['type'] == 'FLAT':
-                        session_fee = component['price']
-                    elif component['type'] == 'TIME':
-                        blocking_fee = component['price']
-                        min_duration = element.get('restrictions', {}).get('min_duration')
-                        if min_duration:
-                            blocking_after = min_duration // 60
-            
             price_data = {
                 'charge_point': charge_point_id,
                 'power_type': power_type,
                 'power': power,
-                'currency': currency,
-                'energy_price': energy_price,
-                'session_fee': session_fee,
-                'blocking_fee': blocking_fee,
-                'blocking_after_minutes': blocking_after
+                'currency': item.get('currency', 'EUR'),
+                **parse_price_components(item)
             }
             
-            self.cache.save_price(
-                pool_id, charge_point_id, tariff_id,
-                power_type, power, market, price_data
-            )
+            return (pool_id, charge_point_id, tariff_id, power_type, power, market, price_data)
             
         except Exception as e:
-            logger.error(f"Error fetching price for {charge_point_id}: {e}")
+            logger.error("Error fetching price for %s: %s", charge_point_id, e)
+            return None
     
-    def force_update(self, pool_id: str, market: str):
+    def force_update(self, pool_id: str, market: str, timeout: Optional[float] = None):
         """
         Immediately update a specific station (for manual refresh button).
-        This bypasses the queue and updates synchronously.
+        This bypasses the queue and blocks until the station is updated (raising
+        TimeoutError after timeout seconds); refreshes requested at the same time
+        are fetched together in one upstream query.
         """
-        start_time = time.time()
-        success = False
-        error_msg = None
+        return self._refresh_batcher.submit(pool_id, market).result(timeout=timeout)
+    
+    def _refresh_batch(self, market: str, pool_ids: List[str]) -> Iterator[Tuple[str, Any]]:
+        """Update a batch of manually refreshed stations, yielding each updated station (or its error) as soon as it's done"""
+        # Stations the update loop (or an earlier refresh) is already updating are
+        # not fetched again; their refresh returns the result of that update
+        claimed, updating = self._claim_updates(pool_ids)
+        try:
+            if claimed:
+                for pool_id, result in self._update_refreshed_stations(market, claimed):
+                    self._release_updates([pool_id])
+                    yield pool_id, result
+        finally:
+            self._release_updates(claimed)
+        
+        for pool_id, event in updating.items():
+            event.wait(UPDATE_WAIT_TIMEOUT_SECONDS)
+            yield pool_id, self.cache.get_station(pool_id)
+    
+    def _update_refreshed_stations(self, market: str, pool_ids: List[str]) -> Iterator[Tuple[str, Any]]:
+        """
+        Update manually refreshed stations of one market, fetching their pool details in
+        one request. Yields each station (or its error) once its prices are saved.
+        """
+        start_time = time.monotonic()
+        
+        # Claim a rate limit slot (one request covers the whole batch's pool details)
+        if not self.cache.try_reserve_requests(1):
+            raise Exception("Rate limit exceeded, please wait a moment")
         
+        pools = self._fetch_pools_details(pool_ids, market)
+        
+        # Pools missing from the response keep their cached data
+        pools = {pool_id: pools[pool_id] for pool_id in pool_ids if pool_id in pools}
+        batch_error = None
+        price_futures = {}
         try:
-            # Check rate limit
-            if not self.cache.can_make_request():
-                raise Exception("Rate limit exceeded, please wait a moment")
-            
-            # Fetch fresh data
-            self._update_station(pool_id, market)
-            self.cache.record_request()
-            
-            success = True
-            self._updates_today += 1
-            self._last_update_time = datetime.utcnow()
-            
+            self.cache.save_stations_bulk(market, list(pools.values()))
+            price_futures = {
+                pool_id: self._submit_price_fetches(pool_id, market, pool_data)
+                for pool_id, pool_data in pools.items()
+            }
         except Exception as e:
-            error_msg = str(e)
-            raise
+            batch_error = e
         
-        finally:
+        log_entries = []
+        for pool_id in pool_ids:
+            error = batch_error
+            if error is None:
+                # Price fetches run in submission order, so earlier stations finish first
+                futures = price_futures.get(pool_id, [])
+                wait(futures)
+                try:
+                    self.cache.save_prices_bulk([future.result() for future in futures if future.result()])
+                except Exception as e:
+                    error = e
+            
+            if error is None:
+                self._record_update()
+                result = self.cache.get_station(pool_id)
+            else:
+                result = error
+            
             # Remove from queue if it was queued
             self.cache.remove_from_queue(pool_id)
             
-            # Log the update
-            duration_ms = int((time.time() - start_time) * 1000)
-            self.cache.log_update(pool_id, 'manual', success, error_msg, duration_ms)
+            duration_ms = int((time.monotonic() - start_time) * 1000)
+            log_entries.append((pool_id, 'manual', error is None, None if error is None else str(error), duration_ms))
+            yield pool_id, result
         
-        return self.cache.get_station(pool_id)
+        # Log the updates
+        self.cache.log_updates_bulk(log_entries)
 
 
 # Global updater instance
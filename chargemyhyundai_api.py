@@ -11,9 +11,61 @@ Requirements:
     pip install requests
 """
 
+import math
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, List, Optional, Tuple
+
+
+# "No filters" criteria for station queries, shared by every call (never mutate)
+EMPTY_FILTER_CRITERIA = {
+    "authenticationMethods": [],
+    "cableAttachedTypes": [],
+    "paymentMethods": [],
+    "plugTypes": [],
+    "poolLocationTypes": [],
+    "valueAddedServices": [],
+    "dcsTcpoIds": []
+}
+
+# Price component type -> price field it sets
+PRICE_COMPONENT_FIELDS = {"ENERGY": "energy_price", "FLAT": "session_fee", "TIME": "blocking_fee"}
+
+
+def parse_price_components(item: dict) -> dict:
+    """
+    Get energy_price, session_fee, blocking_fee and blocking_after_minutes from one
+    price response item in a single pass (fields missing from the response are None,
+    components without a price are skipped, and the last component of each type wins).
+    Shared by the client, the web app and the background updater.
+    """
+    fees = dict.fromkeys(PRICE_COMPONENT_FIELDS.values())
+    fees["blocking_after_minutes"] = None
+    
+    for element in item.get("elements", ()):
+        for component in element.get("price_components", ()):
+            component_type = component.get("type")
+            field = PRICE_COMPONENT_FIELDS.get(component_type)
+            price = component.get("price")
+            if not field or price is None:
+                continue
+            fees[field] = price
+            # Blocking fee applies after the TIME element's minimum duration
+            if component_type == "TIME":
+                min_duration = element.get("restrictions", {}).get("min_duration")
+                if min_duration:
+                    fees["blocking_after_minutes"] = min_duration // 60
+    return fees
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(lat_nw, lng_nw, lat_se, lng_se) of the box reaching radius_km around a point"""
+    lat_offset = radius_km / 111
+    # A degree of longitude shrinks with cos(latitude); clamp so the poles don't divide by zero
+    lng_offset = radius_km / (111 * max(math.cos(math.radians(lat)), 0.01))
+    return lat + lat_offset, lng - lng_offset, lat - lat_offset, lng + lng_offset
 
 
 @dataclass
@@ -49,6 +101,21 @@ class ChargeMyHyundaiAPI:
             "Origin": "https://chargemyhyundai.com",
             "Referer": "https://chargemyhyundai.com/web/de/hyundai-de/map"
         })
+        
+        # Keep enough keep-alive connections for parallel calls from several threads,
+        # and retry gateway errors with backoff (429s are returned to the caller)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=frozenset(["GET", "POST"]),
+                raise_on_status=False
+            )
+        )
+        self.session.mount("https://", adapter)
     
     @property
     def market_url(self) -> str:
@@ -100,30 +167,20 @@ class ChargeMyHyundaiAPI:
         Returns:
             Dict with 'pools' and 'poolClusters' keys
         """
-        # Calculate bounding box
-        lat_offset = radius_km / 111
-        lng_offset = radius_km / (111 * abs(lat) * 0.0175)  # Rough approximation
+        lat_nw, lng_nw, lat_se, lng_se = bounding_box(lat, lng, radius_km)
         
         payload = {
             "searchCriteria": {
-                "latitudeNW": lat + lat_offset,
-                "longitudeNW": lng - lng_offset,
-                "latitudeSE": lat - lat_offset,
-                "longitudeSE": lng + lng_offset,
+                "latitudeNW": lat_nw,
+                "longitudeNW": lng_nw,
+                "latitudeSE": lat_se,
+                "longitudeSE": lng_se,
                 "precision": precision,
                 "unpackSolitudeCluster": True,
                 "unpackClustersWithSinglePool": True
             },
             "withChargePointIds": True,
-            "filterCriteria": {
-                "authenticationMethods": [],
-                "cableAttachedTypes": [],
-                "paymentMethods": [],
-                "plugTypes": [],
-                "poolLocationTypes": [],
-                "valueAddedServices": [],
-                "dcsTcpoIds": []
-            }
+            "filterCriteria": EMPTY_FILTER_CRITERIA
         }
         
         response = self.session.post(
@@ -134,6 +191,20 @@ class ChargeMyHyundaiAPI:
         response.raise_for_status()
         return response.json()
     
+    def find_stations_batch(
+        self,
+        points: Iterable[Tuple[float, float]],
+        radius_km: float = 1.0,
+        precision: int = 10
+    ) -> List[dict]:
+        """
+        Find charging stations around many (lat, lng) points, e.g. to sweep a grid.
+        
+        Returns:
+            One find_stations() result per point, in order
+        """
+        return [self.find_stations(lat, lng, radius_km, precision) for lat, lng in points]
+    
     def get_charge_point_status(self, charge_point_ids: list) -> dict:
         """
         Get real-time availability of charge points.
@@ -190,33 +261,13 @@ class ChargeMyHyundaiAPI:
         response.raise_for_status()
         
         data = response.json()[0]
-        
-        # Parse price components
-        energy_price = 0.0
-        session_fee = 0.0
-        blocking_fee = None
-        blocking_after_min = None
-        
-        for element in data.get("elements", []):
-            for component in element.get("price_components", []):
-                comp_type = component.get("type")
-                price = component.get("price", 0)
-                
-                if comp_type == "ENERGY":
-                    energy_price = price
-                elif comp_type == "FLAT":
-                    session_fee = price
-                elif comp_type == "TIME":
-                    blocking_fee = price
-                    min_duration = element.get("restrictions", {}).get("min_duration")
-                    if min_duration:
-                        blocking_after_min = min_duration // 60
+        fees = parse_price_components(data)
         
         return ChargingPrice(
-            energy_price_per_kwh=energy_price,
-            session_fee=session_fee,
-            blocking_fee_per_hour=blocking_fee,
-            blocking_fee_starts_after_minutes=blocking_after_min,
+            energy_price_per_kwh=fees["energy_price"] or 0.0,
+            session_fee=fees["session_fee"] or 0.0,
+            blocking_fee_per_hour=fees["blocking_fee"],
+            blocking_fee_starts_after_minutes=fees["blocking_after_minutes"],
             currency=data.get("currency", "EUR"),
             power_type=data.get("power_type", power_type)
         )
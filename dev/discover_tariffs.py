@@ -1,7 +1,12 @@
 """Discover all available tariffs"""
+import os
+import sys
 import requests
 import json
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chargemyhyundai_api import parse_price_components
+
 session = requests.Session()
 session.headers.update({
     'Content-Type': 'application/json',
@@ -55,12 +60,10 @@ for tariff_id in [t['id'] for t in tariffs if not t.get('expired', False)]:
             json=[{"charge_point": charge_point_id, "power_type": "AC", "power": 11}]
         )
         if resp.status_code == 200:
-            data = resp.json()[0]
-            energy = next((c['price'] for e in data['elements'] for c in e['price_components'] if c['type'] == 'ENERGY'), None)
-            flat = next((c['price'] for e in data['elements'] for c in e['price_components'] if c['type'] == 'FLAT'), None)
+            fees = parse_price_components(resp.json()[0])
             print(f"\n{tariff_id}:")
-            print(f"  Energy: {energy} EUR/kWh")
-            print(f"  Session Fee: {flat} EUR")
+            print(f"  Energy: {fees['energy_price']} EUR/kWh")
+            print(f"  Session Fee: {fees['session_fee']} EUR")
         else:
             print(f"\n{tariff_id}: Status {resp.status_code}")
     except Exception as e:
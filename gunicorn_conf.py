@@ -0,0 +1,53 @@
+"""
+Gunicorn configuration for ChargeMyHyundai Price Map
+
+Usage:
+    gunicorn -c gunicorn_conf.py app:app
+
+The routes spend most of their time waiting on the ChargeMyHyundai API, so
+threaded workers give cheap concurrency while several worker processes
+sidestep the GIL. For many more concurrent connections per worker, install
+gevent and set GUNICORN_WORKER_CLASS=gevent (gunicorn monkey-patches the
+standard library itself). All settings can be overridden with environment
+variables.
+"""
+
+import fcntl
+import multiprocessing
+import os
+
+# Server socket
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Worker processes
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))  # gthread workers
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))  # gevent workers
+keepalive = 30
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+# Logging
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Start the background updater in exactly one worker process"""
+    from station_cache import DB_PATH
+    
+    # Whichever worker holds the lock file next to the database runs the updater
+    lock_file = open(f"{DB_PATH}.updater.lock", 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # Another worker already owns the updater
+        lock_file.close()
+        return
+    
+    # Keep the file open (and locked) for the lifetime of this worker; if it
+    # dies, the lock is released and its replacement takes over the updater
+    worker.updater_lock = lock_file
+    
+    from app import start_background_updater
+    start_background_updater()
@@ -8,22 +8,327 @@ This module provides persistent caching for:
 """
 
 import sqlite3
-import json
 import threading
 import time
 import os
+import re
+import math
+import queue
+import hashlib
+import zlib
+from collections import deque
+from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any, Tuple
 from contextlib import contextmanager
+from functools import lru_cache
+
+import orjson
 
 # Database file location (configurable via environment variable for Docker)
 DB_PATH = os.environ.get('CACHE_DB_PATH', os.path.join(os.path.dirname(__file__), 'station_cache.db'))
 
 # Cache settings
 CACHE_EXPIRY_HOURS = 24  # Cached data is considered stale after 24 hours
+STALE_AFTER_HOURS = CACHE_EXPIRY_HOURS / 2  # ...and refreshed in the background from here on
 RATE_LIMIT_REQUESTS = 3  # Max requests per rate limit window
 RATE_LIMIT_WINDOW_SECONDS = 10  # Rate limit window
 
+# Read-only connections shared by the request threads for SELECTs
+READ_POOL_SIZE = max(4, os.cpu_count() or 1)
+
+# Coarse grid over station coordinates (0.1° cells), used to narrow bounding box
+# queries when SQLite has no R*Tree module; larger boxes just scan
+GRID_CELLS_PER_DEGREE = 10
+MAX_GRID_CELLS_PER_QUERY = 400
+
+# Columns read by _row_to_station / _row_to_price (hot reads never load raw_data)
+STATION_COLUMNS = (
+    'pool_id, market, cpo_id, cpo_name, location_name, street, city, zip_code, '
+    'latitude, longitude, max_power, plug_types, charge_points_ac, charge_points_dc, '
+    'contact_name, contact_phone, charge_point_count, updated_at'
+)
+PRICE_COLUMNS = (
+    'pool_id, charge_point_id, tariff_id, power_type, power, market, currency, '
+    'energy_price, session_fee, blocking_fee, blocking_after_minutes, updated_at'
+)
+
+# Next batch of queued stations: up to ? of them, from the market of the most urgent one
+NEXT_UPDATES_SQL = '''
+    SELECT pool_id FROM update_queue
+    WHERE market = (
+        SELECT market FROM update_queue
+        ORDER BY priority DESC, added_at ASC
+        LIMIT 1
+    )
+    ORDER BY priority DESC, added_at ASC
+    LIMIT ?
+'''
+CLAIM_NEXT_UPDATES_SQL = f'''
+    DELETE FROM update_queue WHERE pool_id IN ({NEXT_UPDATES_SQL})
+    RETURNING pool_id, market, priority, added_at
+'''
+
+# Statements used on every request or save, kept as constants so each connection's
+# statement cache sees the exact same SQL text every time
+GET_STATION_SQL = f'SELECT {STATION_COLUMNS} FROM stations WHERE pool_id = ?'
+
+# Stations in a bounding box: the R*Tree finds the candidates (its 32-bit floats
+# round outwards), the exact coordinates filter them; a NULL market matches all
+STATIONS_IN_BOUNDS_SQL = f'''
+    SELECT {STATION_COLUMNS} FROM station_bounds b
+    JOIN stations s ON s.rowid = b.id
+    WHERE b.max_lat >= ? AND b.min_lat <= ?
+    AND b.max_lng >= ? AND b.min_lng <= ?
+    AND s.latitude <= ? AND s.latitude >= ?
+    AND s.longitude >= ? AND s.longitude <= ?
+    AND s.market = COALESCE(?, s.market)
+'''
+
+# Stations in a bounding box via the grid cells covering it (see grid_cells_in_bounds)
+STATIONS_IN_GRID_CELLS_SQL = f'''
+    SELECT {STATION_COLUMNS} FROM stations
+    WHERE grid_cell IN (SELECT value FROM json_each(?))
+    AND latitude <= ? AND latitude >= ?
+    AND longitude >= ? AND longitude <= ?
+    AND market = COALESCE(?, market)
+'''
+
+# A refresh resets the station's access count
+UPSERT_STATION_SQL = '''
+    INSERT INTO stations (
+        pool_id, market, cpo_id, cpo_name, location_name, street, city, 
+        zip_code, latitude, longitude, max_power, plug_types,
+        charge_points_ac, charge_points_dc, contact_name, contact_phone,
+        charge_point_count, grid_cell, content_hash, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(pool_id) DO UPDATE SET
+        cpo_name = excluded.cpo_name,
+        location_name = excluded.location_name,
+        street = excluded.street,
+        city = excluded.city,
+        zip_code = excluded.zip_code,
+        latitude = COALESCE(excluded.latitude, latitude),
+        longitude = COALESCE(excluded.longitude, longitude),
+        max_power = excluded.max_power,
+        plug_types = excluded.plug_types,
+        charge_points_ac = excluded.charge_points_ac,
+        charge_points_dc = excluded.charge_points_dc,
+        contact_name = excluded.contact_name,
+        contact_phone = excluded.contact_phone,
+        charge_point_count = COALESCE(excluded.charge_point_count, charge_point_count),
+        grid_cell = COALESCE(excluded.grid_cell, grid_cell),
+        content_hash = excluded.content_hash,
+        updated_at = excluded.updated_at,
+        access_count = 0
+'''
+
+# Lists of pool IDs are passed as one JSON array parameter (expanded by json_each),
+# so the SQL text is the same whatever the number of IDs
+GET_STATIONS_SQL = f'SELECT {STATION_COLUMNS} FROM stations WHERE pool_id IN (SELECT value FROM json_each(?))'
+
+GET_PRICES_SQL = f'''
+    SELECT {PRICE_COLUMNS} FROM prices
+    WHERE pool_id IN (SELECT value FROM json_each(?))
+    AND tariff_id = ? AND power_type = ? AND market = ?
+'''
+
+# One JSON object per pool, {tariff_powertype: price}, with the keys of _row_to_price
+GET_ALL_PRICES_SQL = '''
+    SELECT pool_id, json_group_object(tariff_id || '_' || power_type, json_object(
+        'pool_id', pool_id,
+        'charge_point', charge_point_id,
+        'tariff_id', tariff_id,
+        'power_type', power_type,
+        'power', power,
+        'market', market,
+        'currency', currency,
+        'energy_price', energy_price,
+        'session_fee', session_fee,
+        'blocking_fee', blocking_fee,
+        'blocking_after_minutes', blocking_after_minutes,
+        'updated_at', updated_at,
+        'cached', json('true')
+    ))
+    FROM prices
+    WHERE pool_id IN (SELECT value FROM json_each(?)) AND market = ?
+    GROUP BY pool_id
+'''
+
+GET_PRICE_SQL = f'''
+    SELECT {PRICE_COLUMNS} FROM prices 
+    WHERE pool_id = ? AND tariff_id = ? AND power_type = ? AND market = ?
+'''
+
+UPSERT_PRICE_SQL = '''
+    INSERT INTO prices (
+        pool_id, charge_point_id, tariff_id, power_type, power, market,
+        currency, energy_price, session_fee, blocking_fee, 
+        blocking_after_minutes, raw_data, content_hash, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(pool_id, tariff_id, power_type, market) DO UPDATE SET
+        charge_point_id = excluded.charge_point_id,
+        power = excluded.power,
+        currency = excluded.currency,
+        energy_price = excluded.energy_price,
+        session_fee = excluded.session_fee,
+        blocking_fee = excluded.blocking_fee,
+        blocking_after_minutes = excluded.blocking_after_minutes,
+        raw_data = excluded.raw_data,
+        content_hash = excluded.content_hash,
+        updated_at = excluded.updated_at
+'''
+
+# A queued station keeps its highest priority (and the time it got it)
+UPSERT_QUEUE_SQL = '''
+    INSERT INTO update_queue (pool_id, market, priority, added_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(pool_id) DO UPDATE SET
+        priority = MAX(excluded.priority, update_queue.priority),
+        added_at = CASE 
+            WHEN excluded.priority > update_queue.priority THEN excluded.added_at
+            ELSE update_queue.added_at
+        END
+'''
+
+# Connector classification: plug types we know map straight to AC/DC, anything
+# else is matched against the patterns below (and falls back to the phaseType)
+PLUG_POWER_TYPES = {
+    'TYP2': 'AC', 'TYPE2': 'AC', 'TYP 2': 'AC', 'TYPE 2': 'AC',
+    'CCS': 'DC', 'COMBO': 'DC'
+}
+AC_PLUG_PATTERN = re.compile(r'TYPE? ?2')
+DC_PLUG_PATTERN = re.compile(r'CCS|COMBO')
+
+
+@lru_cache(maxsize=256)
+def plug_power_type(plug_type: str) -> Optional[str]:
+    """'AC' or 'DC' for a recognised plug type, else None (memoized, there are only a few plug types)"""
+    plug_upper = plug_type.upper()
+    return PLUG_POWER_TYPES.get(plug_upper) or (
+        'AC' if AC_PLUG_PATTERN.search(plug_upper)
+        else 'DC' if DC_PLUG_PATTERN.search(plug_upper)
+        else None
+    )
+
+
+def to_json(value: Any) -> str:
+    """Serialize a value for a JSON TEXT column (orjson returns bytes, which SQLite would store as a BLOB)"""
+    return orjson.dumps(value).decode()
+
+
+def grid_cell(latitude: float, longitude: float) -> int:
+    """Number of the GRID_CELLS_PER_DEGREE grid cell containing a coordinate"""
+    row = math.floor(latitude * GRID_CELLS_PER_DEGREE) + 90 * GRID_CELLS_PER_DEGREE
+    column = math.floor(longitude * GRID_CELLS_PER_DEGREE) + 180 * GRID_CELLS_PER_DEGREE
+    return row * 360 * GRID_CELLS_PER_DEGREE + column
+
+
+def grid_cells_in_bounds(lat_nw: float, lng_nw: float, lat_se: float, lng_se: float) -> Optional[List[int]]:
+    """Grid cells overlapping a bounding box, or None if there are more than MAX_GRID_CELLS_PER_QUERY"""
+    rows = range(
+        math.floor(lat_se * GRID_CELLS_PER_DEGREE) + 90 * GRID_CELLS_PER_DEGREE,
+        math.floor(lat_nw * GRID_CELLS_PER_DEGREE) + 90 * GRID_CELLS_PER_DEGREE + 1
+    )
+    columns = range(
+        math.floor(lng_nw * GRID_CELLS_PER_DEGREE) + 180 * GRID_CELLS_PER_DEGREE,
+        math.floor(lng_se * GRID_CELLS_PER_DEGREE) + 180 * GRID_CELLS_PER_DEGREE + 1
+    )
+    if len(rows) * len(columns) > MAX_GRID_CELLS_PER_QUERY:
+        return None
+    return [row * 360 * GRID_CELLS_PER_DEGREE + column for row in rows for column in columns]
+
+
+def content_hash(values: Tuple) -> int:
+    """64-bit hash of the values a row is saved with, to tell whether a save changes anything"""
+    return int.from_bytes(hashlib.blake2b(orjson.dumps(values), digest_size=8).digest(), 'big', signed=True)
+
+
+def pack_raw_data(value: Any) -> bytes:
+    """Serialize and zlib-compress a raw_data value (stored as a BLOB)"""
+    return zlib.compress(orjson.dumps(value), 3)
+
+
+def unpack_raw_data(value: Any) -> Any:
+    """Decode a stored raw_data value (compressed BLOB, or JSON text written by older versions)"""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = zlib.decompress(value)
+    return orjson.loads(value)
+
+
+def connector_power_type(connector: Dict[str, Any]) -> str:
+    """Classify a connector as 'AC' or 'DC' by its plug type, falling back to its phaseType"""
+    return plug_power_type(connector.get('plugType') or '') or connector.get('phaseType', 'AC')
+
+
+def parse_pool(pool: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a raw pool-details record from the API into the station fields we cache.
+    Aggregates (max power, plug types, AC/DC charge points) are computed here once,
+    at write time, so readers never have to walk the charging stations again.
+    """
+    # Extract useful information
+    cpo_name = pool.get('technicalChargePointOperatorName', 'Unbekannt')
+    
+    # Get location details
+    location_name = None
+    street = None
+    city = None
+    zip_code = None
+    
+    locations = pool.get('poolLocations', [])
+    if locations:
+        loc = locations[0]
+        street = loc.get('street')
+        city = loc.get('city')
+        zip_code = loc.get('zipCode')
+        
+        loc_names = loc.get('poolLocationNames', [])
+        if loc_names:
+            location_name = loc_names[0].get('name')
+    
+    # Get contact info
+    contact_name = None
+    contact_phone = None
+    contacts = pool.get('poolContacts', [])
+    if contacts:
+        contact_name = contacts[0].get('name')
+        contact_phone = contacts[0].get('phone')
+    
+    # Flatten to (charge point ID, connector) pairs in one pass
+    connectors = [
+        (cp_id, connector)
+        for station in pool.get('chargingStations', ())
+        for cp in station.get('chargePoints', ())
+        if (cp_id := cp.get('dcsCpId'))
+        for connector in cp.get('connectors', ())
+    ]
+    
+    # Get max power level, plug types, and charge points by AC/DC
+    max_power = max((c.get('powerLevel') or 0 for _, c in connectors), default=0)
+    plug_types = {c['plugType'] for _, c in connectors if c.get('plugType')}
+    # Dicts used as insertion-ordered sets: O(1) dedupe, first charge point stays first
+    charge_points_by_type = {'AC': {}, 'DC': {}}
+    for cp_id, connector in connectors:
+        charge_points_by_type[connector_power_type(connector)][cp_id] = None
+    
+    return {
+        'pool_id': pool.get('dcsPoolId'),
+        'cpo_name': cpo_name,
+        'location_name': location_name,
+        'street': street,
+        'city': city,
+        'zip_code': zip_code,
+        'contact_name': contact_name,
+        'contact_phone': contact_phone,
+        'max_power': max_power,
+        'plug_types': list(plug_types),
+        'charge_points_ac': list(charge_points_by_type['AC']),
+        'charge_points_dc': list(charge_points_by_type['DC'])
+    }
+
 
 class StationCache:
     """SQLite-based cache for charging station data"""
@@ -32,33 +337,121 @@ class StationCache:
         self.db_path = db_path
         self._local = threading.local()
         
+        # Pool of read-only connections (opened lazily, up to READ_POOL_SIZE)
+        self._readers: queue.Queue = queue.Queue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        
         # Ensure database directory exists
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
         
+        # journal_mode=WAL is stored in the database file, so it only needs setting once
+        self._wal_enabled = threading.Event()
+        
+        # Set by _init_db() if SQLite was built with the R*Tree module
+        self._has_rtree = False
+        
         self._init_db()
         
         # Rate limiting state
-        self._rate_limit_lock = threading.Lock()
-        self._request_times: List[float] = []
+        # Waiters sleep on the condition until the next slot frees up; it is
+        # notified whenever a request is recorded so they re-check their wait
+        self._rate_limit_condition = threading.Condition(threading.RLock())
+        # Monotonic times of the last RATE_LIMIT_REQUESTS requests (older ones fall out)
+        self._request_times: deque = deque(maxlen=RATE_LIMIT_REQUESTS)
+        
+        # Signalled whenever a station is queued, so the updater wakes up immediately
+        self._queue_condition = threading.Condition()
+        self._queue_signalled = False
         
         # Background update state
         self._update_thread: Optional[threading.Thread] = None
         self._update_running = False
         self._update_stop_event = threading.Event()
     
-    def _get_conn(self) -> sqlite3.Connection:
-        """Get thread-local database connection"""
-        if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect(
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open a database connection with WAL and cache pragmas applied"""
+        if read_only:
+            conn = sqlite3.connect(
+                f"{Path(self.db_path).resolve().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                timeout=30.0,
+                cached_statements=256
+            )
+            # Reject writes up front as well, so a reader never takes part in write locking
+            conn.execute('PRAGMA query_only=1')
+        else:
+            conn = sqlite3.connect(
                 self.db_path,
                 check_same_thread=False,
-                timeout=30.0
+                timeout=30.0,
+                cached_statements=256
             )
-            self._local.conn.row_factory = sqlite3.Row
+            # WAL lets readers run concurrently with the (single) writer
+            if not self._wal_enabled.is_set():
+                conn.execute('PRAGMA journal_mode=WAL')
+                self._wal_enabled.set()
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            PRAGMA busy_timeout=30000;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+        ''')
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def _get_conn(self) -> sqlite3.Connection:
+        """Get thread-local database connection"""
+        if not hasattr(self._local, 'conn') or self._local.conn is None:
+            self._local.conn = self._connect()
         return self._local.conn
     
+    def _get_reader(self) -> sqlite3.Connection:
+        """Take a read-only connection from the pool, opening one if the pool isn't full yet"""
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._reader_lock:
+            open_new = self._reader_count < READ_POOL_SIZE
+            if open_new:
+                self._reader_count += 1
+        if not open_new:
+            return self._readers.get()
+        
+        try:
+            return self._connect(read_only=True)
+        except Exception:
+            with self._reader_lock:
+                self._reader_count -= 1
+            raise
+    
+    def close(self):
+        """Close this thread's connection, letting SQLite refresh its query planner statistics first"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        
+        self._local.conn = None
+        try:
+            conn.execute('PRAGMA optimize')
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def _read_cursor(self):
+        """Context manager for a cursor on a pooled read-only connection"""
+        conn = self._get_reader()
+        try:
+            yield conn.cursor()
+        finally:
+            self._readers.put(conn)
+    
     @contextmanager
     def _cursor(self):
         """Context manager for database cursor with commit"""
@@ -74,6 +467,10 @@ class StationCache:
     def _init_db(self):
         """Initialize database schema"""
         with self._cursor() as cursor:
+            # Every worker process runs this at startup; the write lock makes the schema
+            # checks and migrations below one step, so workers never migrate at once
+            cursor.execute('BEGIN IMMEDIATE')
+            
             # Stations table - stores pool details
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS stations (
@@ -94,12 +491,51 @@ class StationCache:
                     contact_name TEXT,
                     contact_phone TEXT,
                     charge_point_count INTEGER,
-                    raw_data TEXT,  -- Full API response for reference
+                    grid_cell INTEGER,  -- grid_cell() of the coordinates
+                    content_hash INTEGER,  -- content_hash() of the saved values
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    accessed_at TIMESTAMP,  -- Last time a client asked for the details
+                    access_count INTEGER DEFAULT 0  -- Hours with client access since the last update
                 )
             ''')
             
+            # Columns added after a database may already have been created
+            columns = {row['name'] for row in cursor.execute('PRAGMA table_info(stations)')}
+            for column, definition in (
+                ('accessed_at', 'TIMESTAMP'),
+                ('access_count', 'INTEGER DEFAULT 0'),
+                ('content_hash', 'INTEGER'),
+                ('grid_cell', 'INTEGER')
+            ):
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE stations ADD COLUMN {column} {definition}')
+            if 'grid_cell' not in columns:
+                cursor.execute('SELECT pool_id, latitude, longitude FROM stations WHERE latitude IS NOT NULL AND longitude IS NOT NULL')
+                cursor.executemany(
+                    'UPDATE stations SET grid_cell = ? WHERE pool_id = ?',
+                    [(grid_cell(row['latitude'], row['longitude']), row['pool_id']) for row in cursor.fetchall()]
+                )
+            
+            # Full API data of each station, kept out of the stations table so that
+            # map queries don't drag it along
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stations_raw (
+                    pool_id TEXT PRIMARY KEY,
+                    raw_data BLOB  -- Full API response for reference (see pack_raw_data)
+                )
+            ''')
+            if 'raw_data' in columns:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO stations_raw (pool_id, raw_data)
+                    SELECT pool_id, raw_data FROM stations WHERE raw_data IS NOT NULL
+                ''')
+                if sqlite3.sqlite_version_info >= (3, 35):
+                    cursor.execute('ALTER TABLE stations DROP COLUMN raw_data')
+                else:
+                    # No DROP COLUMN before SQLite 3.35: leave the column empty and unused
+                    cursor.execute('UPDATE stations SET raw_data = NULL WHERE raw_data IS NOT NULL')
+            
             # Prices table - stores price data by station, tariff, and power type
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS prices (
@@ -115,13 +551,18 @@ class StationCache:
                     session_fee REAL,
                     blocking_fee REAL,
                     blocking_after_minutes INTEGER,
-                    raw_data TEXT,  -- Full price response
+                    raw_data BLOB,  -- Full price response (see pack_raw_data)
+                    content_hash INTEGER,  -- content_hash() of the saved values
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(pool_id, tariff_id, power_type, market)
                 )
             ''')
             
+            price_columns = {row['name'] for row in cursor.execute('PRAGMA table_info(prices)')}
+            if 'content_hash' not in price_columns:
+                cursor.execute('ALTER TABLE prices ADD COLUMN content_hash INTEGER')
+            
             # Update queue - tracks stations needing updates
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS update_queue (
@@ -147,19 +588,89 @@ class StationCache:
                 )
             ''')
             
+            # CPO table - operator info, shared by all worker processes
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cpos (
+                    cpo_id TEXT PRIMARY KEY,
+                    data TEXT,  -- JSON API response
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            self._init_rtree(cursor)
+            
             # Create indexes for faster queries
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stations_market ON stations(market)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stations_market_updated ON stations(market, updated_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stations_market_location ON stations(market, latitude, longitude)')
+            cursor.execute('DROP INDEX IF EXISTS idx_stations_market')  # Covered by the two above
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_stations_updated ON stations(updated_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stations_grid ON stations(grid_cell)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_prices_pool ON prices(pool_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_prices_market_pool ON prices(market, pool_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_prices_updated ON prices(updated_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_log_created ON update_log(created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_queue_priority ON update_queue(priority DESC, added_at ASC)')
     
+    def _init_rtree(self, cursor: sqlite3.Cursor):
+        """
+        Create the station_bounds R*Tree index over station coordinates, kept in sync
+        with the stations table by triggers. Without the R*Tree module bounding box
+        queries fall back to scanning the stations table.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'station_bounds'")
+        exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS station_bounds
+                USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+            ''')
+        except sqlite3.OperationalError:
+            return
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stations_bounds_insert AFTER INSERT ON stations
+            WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+            BEGIN
+                INSERT OR REPLACE INTO station_bounds
+                VALUES (new.rowid, new.latitude, new.latitude, new.longitude, new.longitude);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stations_bounds_update AFTER UPDATE OF latitude, longitude ON stations
+            BEGIN
+                DELETE FROM station_bounds WHERE id = old.rowid;
+                INSERT INTO station_bounds
+                SELECT new.rowid, new.latitude, new.latitude, new.longitude, new.longitude
+                WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stations_bounds_delete AFTER DELETE ON stations
+            BEGIN
+                DELETE FROM station_bounds WHERE id = old.rowid;
+            END
+        ''')
+        
+        if not exists:
+            self._rebuild_rtree(cursor)
+        self._has_rtree = True
+    
+    def _rebuild_rtree(self, cursor: sqlite3.Cursor):
+        """Refill station_bounds from the stations table"""
+        cursor.execute('DELETE FROM station_bounds')
+        cursor.execute('''
+            INSERT INTO station_bounds
+            SELECT rowid, latitude, latitude, longitude, longitude FROM stations
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+    
     # ==================== Station Methods ====================
     
     def get_station(self, pool_id: str) -> Optional[Dict[str, Any]]:
         """Get cached station data by pool ID"""
-        with self._cursor() as cursor:
-            cursor.execute('SELECT * FROM stations WHERE pool_id = ?', (pool_id,))
+        with self._read_cursor() as cursor:
+            cursor.execute(GET_STATION_SQL, (pool_id,))
             row = cursor.fetchone()
             if row:
                 return self._row_to_station(row)
@@ -171,12 +682,8 @@ class StationCache:
             return {}
         
         result = {}
-        with self._cursor() as cursor:
-            placeholders = ','.join('?' * len(pool_ids))
-            cursor.execute(
-                f'SELECT * FROM stations WHERE pool_id IN ({placeholders})',
-                pool_ids
-            )
+        with self._read_cursor() as cursor:
+            cursor.execute(GET_STATIONS_SQL, (to_json(pool_ids),))
             for row in cursor.fetchall():
                 station = self._row_to_station(row)
                 result[station['pool_id']] = station
@@ -190,10 +697,21 @@ class StationCache:
         Returns stations with coordinates for fast initial map display.
         """
         result = []
-        with self._cursor() as cursor:
-            if market:
-                cursor.execute('''
-                    SELECT * FROM stations 
+        with self._read_cursor() as cursor:
+            if self._has_rtree:
+                cursor.execute(
+                    STATIONS_IN_BOUNDS_SQL,
+                    (lat_se, lat_nw, lng_nw, lng_se, lat_nw, lat_se, lng_nw, lng_se, market)
+                )
+            elif (cells := grid_cells_in_bounds(lat_nw, lng_nw, lat_se, lng_se)) is not None:
+                # Look up the grid cells covering the box, then filter on the exact coordinates
+                cursor.execute(
+                    STATIONS_IN_GRID_CELLS_SQL,
+                    (to_json(cells), lat_nw, lat_se, lng_nw, lng_se, market)
+                )
+            elif market:
+                cursor.execute(f'''
+                    SELECT {STATION_COLUMNS} FROM stations 
                     WHERE latitude IS NOT NULL 
                     AND longitude IS NOT NULL
                     AND latitude <= ? AND latitude >= ?
@@ -201,8 +719,8 @@ class StationCache:
                     AND market = ?
                 ''', (lat_nw, lat_se, lng_nw, lng_se, market))
             else:
-                cursor.execute('''
-                    SELECT * FROM stations 
+                cursor.execute(f'''
+                    SELECT {STATION_COLUMNS} FROM stations 
                     WHERE latitude IS NOT NULL 
                     AND longitude IS NOT NULL
                     AND latitude <= ? AND latitude >= ?
@@ -219,17 +737,17 @@ class StationCache:
         Returns stations with coordinates.
         """
         result = []
-        with self._cursor() as cursor:
+        with self._read_cursor() as cursor:
             if market:
-                cursor.execute('''
-                    SELECT * FROM stations 
+                cursor.execute(f'''
+                    SELECT {STATION_COLUMNS} FROM stations 
                     WHERE latitude IS NOT NULL 
                     AND longitude IS NOT NULL
                     AND market = ?
                 ''', (market,))
             else:
-                cursor.execute('''
-                    SELECT * FROM stations 
+                cursor.execute(f'''
+                    SELECT {STATION_COLUMNS} FROM stations 
                     WHERE latitude IS NOT NULL 
                     AND longitude IS NOT NULL
                 ''')
@@ -238,38 +756,53 @@ class StationCache:
                 result.append(self._row_to_station(row))
         return result
     
+    def get_stations_version(self, market: str = None) -> Tuple[Optional[str], int]:
+        """
+        Get (latest updated_at, station count) for the cached stations.
+        Changes whenever a station is added or updated, so it can be used as a cheap ETag.
+        """
+        with self._read_cursor() as cursor:
+            if market:
+                cursor.execute('SELECT MAX(updated_at), COUNT(*) FROM stations WHERE market = ?', (market,))
+            else:
+                cursor.execute('SELECT MAX(updated_at), COUNT(*) FROM stations')
+            row = cursor.fetchone()
+            return (row[0], row[1])
+    
     def save_station(self, pool_id: str, market: str, data: Dict[str, Any], 
                      latitude: float = None, longitude: float = None,
                      charge_point_count: int = None, cpo_id: str = None):
         """Save or update station data in cache"""
-        with self._cursor() as cursor:
-            now = datetime.utcnow().isoformat()
-            
-            cursor.execute('''
-                INSERT INTO stations (
-                    pool_id, market, cpo_id, cpo_name, location_name, street, city, 
-                    zip_code, latitude, longitude, max_power, plug_types,
-                    charge_points_ac, charge_points_dc, contact_name, contact_phone,
-                    charge_point_count, raw_data, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(pool_id) DO UPDATE SET
-                    cpo_name = excluded.cpo_name,
-                    location_name = excluded.location_name,
-                    street = excluded.street,
-                    city = excluded.city,
-                    zip_code = excluded.zip_code,
-                    latitude = COALESCE(excluded.latitude, latitude),
-                    longitude = COALESCE(excluded.longitude, longitude),
-                    max_power = excluded.max_power,
-                    plug_types = excluded.plug_types,
-                    charge_points_ac = excluded.charge_points_ac,
-                    charge_points_dc = excluded.charge_points_dc,
-                    contact_name = excluded.contact_name,
-                    contact_phone = excluded.contact_phone,
-                    charge_point_count = COALESCE(excluded.charge_point_count, charge_point_count),
-                    raw_data = excluded.raw_data,
-                    updated_at = excluded.updated_at
-            ''', (
+        self._save_station_rows([
+            (pool_id, market, data, latitude, longitude, charge_point_count, cpo_id)
+        ])
+    
+    def get_station_raw_data(self, pool_id: str) -> Optional[Dict[str, Any]]:
+        """Get the full data a station was last saved with (for debugging)"""
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT raw_data FROM stations_raw WHERE pool_id = ?', (pool_id,))
+            row = cursor.fetchone()
+            return unpack_raw_data(row['raw_data']) if row else None
+    
+    def save_stations_bulk(self, market: str, stations: List[Dict[str, Any]]):
+        """Save or update many parsed stations (see parse_pool) in a single transaction"""
+        self._save_station_rows([
+            (data['pool_id'], market, data, None, None, None, None) for data in stations
+        ])
+    
+    def _save_station_rows(self, rows: List[Tuple]):
+        """
+        Upsert (pool_id, market, data, latitude, longitude, charge_point_count, cpo_id) rows
+        with one commit. Stations whose content hasn't changed only get their updated_at
+        bumped instead of being rewritten.
+        """
+        if not rows:
+            return
+        
+        now = datetime.utcnow().isoformat()
+        # Serialize outside the transaction so the write lock is held as briefly as possible
+        values = [
+            (
                 pool_id,
                 market,
                 cpo_id,
@@ -281,16 +814,55 @@ class StationCache:
                 latitude,
                 longitude,
                 data.get('max_power'),
-                json.dumps(data.get('plug_types', [])),
-                json.dumps(data.get('charge_points_ac', [])),
-                json.dumps(data.get('charge_points_dc', [])),
+                to_json(data.get('plug_types', [])),
+                to_json(data.get('charge_points_ac', [])),
+                to_json(data.get('charge_points_dc', [])),
                 data.get('contact_name'),
                 data.get('contact_phone'),
                 charge_point_count,
-                json.dumps(data),
-                now,
-                now
-            ))
+                grid_cell(latitude, longitude) if latitude is not None and longitude is not None else None
+            )
+            for pool_id, market, data, latitude, longitude, charge_point_count, cpo_id in rows
+        ]
+        hashes = [content_hash(row_values) for row_values in values]
+        raw_data = [pack_raw_data(row[2]) for row in rows]
+        
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT pool_id, content_hash FROM stations WHERE pool_id IN (SELECT value FROM json_each(?))',
+                (to_json([row_values[0] for row_values in values]),)
+            )
+            stored_hashes = {row['pool_id']: row['content_hash'] for row in cursor.fetchall()}
+            
+            unchanged = [stored_hashes.get(row_values[0]) == row_hash for row_values, row_hash in zip(values, hashes)]
+            cursor.executemany(
+                'UPDATE stations SET updated_at = ?, access_count = 0 WHERE pool_id = ?',
+                [(now, row_values[0]) for row_values, same in zip(values, unchanged) if same]
+            )
+            
+            cursor.executemany(UPSERT_STATION_SQL, [
+                (*row_values, row_hash, now, now)
+                for row_values, row_hash, same in zip(values, hashes, unchanged) if not same
+            ])
+            cursor.executemany(
+                'INSERT OR REPLACE INTO stations_raw (pool_id, raw_data) VALUES (?, ?)',
+                [
+                    (row_values[0], row_raw_data)
+                    for row_values, row_raw_data, same in zip(values, raw_data, unchanged) if not same
+                ]
+            )
+    
+    def save_pool(self, pool: Dict[str, Any], market: str) -> Dict[str, Any]:
+        """Parse a raw pool-details record from the API, save it and return the parsed station data"""
+        data = parse_pool(pool)
+        self.save_station(data['pool_id'], market, data)
+        return data
+    
+    def save_pools(self, pools: List[Dict[str, Any]], market: str) -> List[Dict[str, Any]]:
+        """Parse and save many raw pool-details records in one transaction, returning the parsed data"""
+        stations = [data for data in map(parse_pool, pools) if data['pool_id']]
+        self.save_stations_bulk(market, stations)
+        return stations
     
     def _row_to_station(self, row: sqlite3.Row) -> Dict[str, Any]:
         """Convert database row to station dict"""
@@ -306,9 +878,9 @@ class StationCache:
             'latitude': row['latitude'],
             'longitude': row['longitude'],
             'max_power': row['max_power'],
-            'plug_types': json.loads(row['plug_types']) if row['plug_types'] else [],
-            'charge_points_ac': json.loads(row['charge_points_ac']) if row['charge_points_ac'] else [],
-            'charge_points_dc': json.loads(row['charge_points_dc']) if row['charge_points_dc'] else [],
+            'plug_types': orjson.loads(row['plug_types']) if row['plug_types'] else [],
+            'charge_points_ac': orjson.loads(row['charge_points_ac']) if row['charge_points_ac'] else [],
+            'charge_points_dc': orjson.loads(row['charge_points_dc']) if row['charge_points_dc'] else [],
             'contact_name': row['contact_name'],
             'contact_phone': row['contact_phone'],
             'charge_point_count': row['charge_point_count'],
@@ -316,16 +888,36 @@ class StationCache:
             'cached': True
         }
     
+    # ==================== CPO Methods ====================
+    
+    def get_cpo(self, cpo_id: str, max_age_hours: Optional[int] = CACHE_EXPIRY_HOURS) -> Optional[Dict[str, Any]]:
+        """Get cached CPO info, or None if missing or older than max_age_hours (None = any age)"""
+        with self._read_cursor() as cursor:
+            if max_age_hours is None:
+                cursor.execute('SELECT data FROM cpos WHERE cpo_id = ?', (cpo_id,))
+            else:
+                cutoff = (datetime.utcnow() - timedelta(hours=max_age_hours)).isoformat()
+                cursor.execute('SELECT data FROM cpos WHERE cpo_id = ? AND updated_at >= ?', (cpo_id, cutoff))
+            row = cursor.fetchone()
+            return orjson.loads(row['data']) if row else None
+    
+    def save_cpo(self, cpo_id: str, data: Dict[str, Any]):
+        """Save or update CPO info"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO cpos (cpo_id, data, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(cpo_id) DO UPDATE SET
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+            ''', (cpo_id, to_json(data), datetime.utcnow().isoformat()))
+    
     # ==================== Price Methods ====================
     
     def get_price(self, pool_id: str, tariff_id: str, power_type: str, 
                   market: str) -> Optional[Dict[str, Any]]:
         """Get cached price for a station"""
-        with self._cursor() as cursor:
-            cursor.execute('''
-                SELECT * FROM prices 
-                WHERE pool_id = ? AND tariff_id = ? AND power_type = ? AND market = ?
-            ''', (pool_id, tariff_id, power_type, market))
+        with self._read_cursor() as cursor:
+            cursor.execute(GET_PRICE_SQL, (pool_id, tariff_id, power_type, market))
             row = cursor.fetchone()
             if row:
                 return self._row_to_price(row)
@@ -338,13 +930,8 @@ class StationCache:
             return {}
         
         result = {}
-        with self._cursor() as cursor:
-            placeholders = ','.join('?' * len(pool_ids))
-            cursor.execute(f'''
-                SELECT * FROM prices 
-                WHERE pool_id IN ({placeholders}) 
-                AND tariff_id = ? AND power_type = ? AND market = ?
-            ''', (*pool_ids, tariff_id, power_type, market))
+        with self._read_cursor() as cursor:
+            cursor.execute(GET_PRICES_SQL, (to_json(pool_ids), tariff_id, power_type, market))
             for row in cursor.fetchall():
                 price = self._row_to_price(row)
                 result[price['pool_id']] = price
@@ -359,46 +946,27 @@ class StationCache:
         if not pool_ids:
             return {}
         
-        result = {}
-        with self._cursor() as cursor:
-            placeholders = ','.join('?' * len(pool_ids))
-            cursor.execute(f'''
-                SELECT * FROM prices 
-                WHERE pool_id IN ({placeholders}) AND market = ?
-            ''', (*pool_ids, market))
-            for row in cursor.fetchall():
-                price = self._row_to_price(row)
-                pool_id = price['pool_id']
-                key = f"{price['tariff_id']}_{price['power_type']}"
-                
-                if pool_id not in result:
-                    result[pool_id] = {}
-                result[pool_id][key] = price
-        return result
+        # SQLite builds each pool's nested dict as JSON, Python decodes it once per pool
+        with self._read_cursor() as cursor:
+            cursor.execute(GET_ALL_PRICES_SQL, (to_json(pool_ids), market))
+            return {pool_id: orjson.loads(prices) for pool_id, prices in cursor.fetchall()}
     
     def save_price(self, pool_id: str, charge_point_id: str, tariff_id: str,
                    power_type: str, power: int, market: str, data: Dict[str, Any]):
         """Save or update price data in cache"""
-        with self._cursor() as cursor:
-            now = datetime.utcnow().isoformat()
-            
-            cursor.execute('''
-                INSERT INTO prices (
-                    pool_id, charge_point_id, tariff_id, power_type, power, market,
-                    currency, energy_price, session_fee, blocking_fee, 
-                    blocking_after_minutes, raw_data, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(pool_id, tariff_id, power_type, market) DO UPDATE SET
-                    charge_point_id = excluded.charge_point_id,
-                    power = excluded.power,
-                    currency = excluded.currency,
-                    energy_price = excluded.energy_price,
-                    session_fee = excluded.session_fee,
-                    blocking_fee = excluded.blocking_fee,
-                    blocking_after_minutes = excluded.blocking_after_minutes,
-                    raw_data = excluded.raw_data,
-                    updated_at = excluded.updated_at
-            ''', (
+        self.save_prices_bulk([(pool_id, charge_point_id, tariff_id, power_type, power, market, data)])
+    
+    def save_prices_bulk(self, rows: List[Tuple]):
+        """
+        Save or update many prices in a single transaction. Each row holds the
+        save_price() arguments: (pool_id, charge_point_id, tariff_id, power_type, power, market, data)
+        """
+        if not rows:
+            return
+        
+        now = datetime.utcnow().isoformat()
+        values = [
+            (
                 pool_id,
                 charge_point_id,
                 tariff_id,
@@ -409,11 +977,37 @@ class StationCache:
                 data.get('energy_price'),
                 data.get('session_fee'),
                 data.get('blocking_fee'),
-                data.get('blocking_after_minutes'),
-                json.dumps(data),
-                now,
-                now
-            ))
+                data.get('blocking_after_minutes')
+            )
+            for pool_id, charge_point_id, tariff_id, power_type, power, market, data in rows
+        ]
+        hashes = [content_hash(row_values) for row_values in values]
+        raw_data = [pack_raw_data(row[6]) for row in rows]
+        
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT pool_id, tariff_id, power_type, market, content_hash FROM prices
+                WHERE pool_id IN (SELECT value FROM json_each(?))
+            ''', (to_json(list({row_values[0] for row_values in values})),))
+            stored_hashes = {tuple(row[:4]): row['content_hash'] for row in cursor.fetchall()}
+            
+            # Prices are keyed by (pool_id, tariff_id, power_type, market)
+            unchanged = [
+                stored_hashes.get((row_values[0], row_values[2], row_values[3], row_values[5])) == row_hash
+                for row_values, row_hash in zip(values, hashes)
+            ]
+            cursor.executemany('''
+                UPDATE prices SET updated_at = ?
+                WHERE pool_id = ? AND tariff_id = ? AND power_type = ? AND market = ?
+            ''', [
+                (now, row_values[0], row_values[2], row_values[3], row_values[5])
+                for row_values, same in zip(values, unchanged) if same
+            ])
+            
+            cursor.executemany(UPSERT_PRICE_SQL, [
+                (*row_values, row_raw_data, row_hash, now, now)
+                for row_values, row_raw_data, row_hash, same in zip(values, raw_data, hashes, unchanged) if not same
+            ])
     
     def _row_to_price(self, row: sqlite3.Row) -> Dict[str, Any]:
         """Convert database row to price dict"""
@@ -436,19 +1030,18 @@ class StationCache:
     # ==================== Cache Freshness ====================
     
     def is_station_stale(self, pool_id: str, max_age_hours: int = CACHE_EXPIRY_HOURS) -> bool:
-        """Check if station data needs updating"""
-        station = self.get_station(pool_id)
-        if not station:
-            return True
-        
-        updated_at = datetime.fromisoformat(station['updated_at'])
-        age = datetime.utcnow() - updated_at
-        return age > timedelta(hours=max_age_hours)
+        """Check if station data needs updating (missing stations are stale too)"""
+        # updated_at is an ISO timestamp, so comparing strings compares times
+        cutoff = (datetime.utcnow() - timedelta(hours=max_age_hours)).isoformat()
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT 1 FROM stations WHERE pool_id = ? AND updated_at >= ?', (pool_id, cutoff))
+            return cursor.fetchone() is None
     
-    def get_stale_stations(self, market: str = None, limit: int = 100) -> List[str]:
-        """Get list of station IDs that need updating"""
-        with self._cursor() as cursor:
-            cutoff = (datetime.utcnow() - timedelta(hours=CACHE_EXPIRY_HOURS)).isoformat()
+    def get_stale_stations(self, market: str = None, limit: int = 100,
+                           max_age_hours: float = CACHE_EXPIRY_HOURS) -> List[str]:
+        """Get list of station IDs older than max_age_hours (oldest first)"""
+        with self._read_cursor() as cursor:
+            cutoff = (datetime.utcnow() - timedelta(hours=max_age_hours)).isoformat()
             
             if market:
                 cursor.execute('''
@@ -467,35 +1060,110 @@ class StationCache:
             
             return [row['pool_id'] for row in cursor.fetchall()]
     
+    def touch_stations(self, pool_ids: List[str]):
+        """
+        Record that clients asked for these stations (the more often a station is
+        read, the sooner it is refreshed). Callers touch each station at most hourly.
+        """
+        if not pool_ids:
+            return
+        
+        with self._cursor() as cursor:
+            cursor.execute(
+                'UPDATE stations SET accessed_at = ?, access_count = access_count + 1 '
+                'WHERE pool_id IN (SELECT value FROM json_each(?))',
+                (datetime.utcnow().isoformat(), to_json(pool_ids))
+            )
+    
+    def get_refresh_times(self, updated_since: str = '') -> List[Tuple[str, str, str]]:
+        """Get (pool_id, market, updated_at) of stations updated at or after updated_since, oldest first"""
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+                SELECT pool_id, market, updated_at FROM stations
+                WHERE updated_at >= ?
+                ORDER BY updated_at ASC
+            ''', (updated_since,))
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def get_refresh_info(self, pool_ids: List[str]) -> Dict[str, Tuple[str, int]]:
+        """Get {pool_id: (updated_at, access_count)} of the given stations that are cached"""
+        if not pool_ids:
+            return {}
+        
+        with self._read_cursor() as cursor:
+            cursor.execute(
+                'SELECT pool_id, updated_at, access_count FROM stations '
+                'WHERE pool_id IN (SELECT value FROM json_each(?))',
+                (to_json(pool_ids),)
+            )
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    
     # ==================== Update Queue ====================
     
     def queue_update(self, pool_id: str, market: str, priority: int = 0):
         """Add a station to the update queue"""
+        self.queue_updates_bulk([(pool_id, market, priority)])
+    
+    def queue_updates_bulk(self, items: List[Tuple[str, str, int]]):
+        """Add many (pool_id, market, priority) entries to the update queue in one transaction"""
+        # Keep one entry per station with its highest priority, like the upsert does
+        entries: Dict[str, Tuple[str, int]] = {}
+        for pool_id, market, priority in items:
+            if pool_id not in entries or priority > entries[pool_id][1]:
+                entries[pool_id] = (market, priority)
+        if not entries:
+            return
+        
+        now = datetime.utcnow().isoformat()
         with self._cursor() as cursor:
-            now = datetime.utcnow().isoformat()
-            cursor.execute('''
-                INSERT INTO update_queue (pool_id, market, priority, added_at)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(pool_id) DO UPDATE SET
-                    priority = MAX(excluded.priority, update_queue.priority),
-                    added_at = CASE 
-                        WHEN excluded.priority > update_queue.priority THEN excluded.added_at
-                        ELSE update_queue.added_at
-                    END
-            ''', (pool_id, market, priority, now))
-    
-    def get_next_update(self) -> Optional[Tuple[str, str]]:
-        """Get next station to update from queue"""
+            cursor.executemany(
+                UPSERT_QUEUE_SQL,
+                [(pool_id, market, priority, now) for pool_id, (market, priority) in entries.items()]
+            )
+        self.wake_queue_waiters()
+    
+    def wake_queue_waiters(self):
+        """Wake threads blocked in wait_for_queue()"""
+        with self._queue_condition:
+            self._queue_signalled = True
+            self._queue_condition.notify_all()
+    
+    def wait_for_queue(self, timeout: float) -> bool:
+        """Block until a station is queued in this process (or timeout), returns True if woken"""
+        with self._queue_condition:
+            woken = self._queue_condition.wait_for(lambda: self._queue_signalled, timeout)
+            self._queue_signalled = False
+            return woken
+    
+    def claim_next_update(self) -> Optional[Tuple[str, str]]:
+        """Take the next station to update off the queue, returns (pool_id, market) or None"""
+        items = self.claim_next_updates(1)
+        return items[0] if items else None
+    
+    def claim_next_updates(self, limit: int) -> List[Tuple[str, str]]:
+        """
+        Take up to limit stations to update next off the queue, all from the market of
+        the first one. Selecting and removing them is one step, so no other worker can
+        claim the same stations.
+        """
         with self._cursor() as cursor:
-            cursor.execute('''
-                SELECT pool_id, market FROM update_queue
-                ORDER BY priority DESC, added_at ASC
-                LIMIT 1
-            ''')
-            row = cursor.fetchone()
-            if row:
-                return (row['pool_id'], row['market'])
-        return None
+            if sqlite3.sqlite_version_info >= (3, 35):
+                cursor.execute(CLAIM_NEXT_UPDATES_SQL, (limit,))
+                rows = cursor.fetchall()
+            else:
+                # No RETURNING before SQLite 3.35: take the write lock first instead
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute(
+                    f'SELECT pool_id, market, priority, added_at FROM update_queue WHERE pool_id IN ({NEXT_UPDATES_SQL})',
+                    (limit,)
+                )
+                rows = cursor.fetchall()
+                cursor.executemany('DELETE FROM update_queue WHERE pool_id = ?', [(row['pool_id'],) for row in rows])
+        
+        # Neither RETURNING nor the IN subquery keeps the queue order, so restore it here
+        rows.sort(key=lambda row: row['added_at'])
+        rows.sort(key=lambda row: row['priority'], reverse=True)
+        return [(row['pool_id'], row['market']) for row in rows]
     
     def remove_from_queue(self, pool_id: str):
         """Remove station from update queue"""
@@ -504,51 +1172,75 @@ class StationCache:
     
     def get_queue_size(self) -> int:
         """Get number of stations in update queue"""
-        with self._cursor() as cursor:
+        with self._read_cursor() as cursor:
             cursor.execute('SELECT COUNT(*) FROM update_queue')
             return cursor.fetchone()[0]
     
     # ==================== Rate Limiting ====================
     
+    def _seconds_until_request_allowed(self) -> float:
+        """Time until the rate limit allows another request (0 if it already does)"""
+        with self._rate_limit_condition:
+            if len(self._request_times) < RATE_LIMIT_REQUESTS:
+                return 0.0
+            # A slot frees up when the oldest of the last RATE_LIMIT_REQUESTS requests leaves the window
+            return max(0.0, self._request_times[0] + RATE_LIMIT_WINDOW_SECONDS - time.monotonic())
+    
     def can_make_request(self) -> bool:
         """Check if we can make an API request within rate limits"""
-        with self._rate_limit_lock:
-            now = time.time()
-            # Remove old request times outside the window
-            self._request_times = [
-                t for t in self._request_times 
-                if now - t < RATE_LIMIT_WINDOW_SECONDS
-            ]
-            return len(self._request_times) < RATE_LIMIT_REQUESTS
+        return self._seconds_until_request_allowed() == 0
     
     def record_request(self):
         """Record that an API request was made"""
-        with self._rate_limit_lock:
-            self._request_times.append(time.time())
+        with self._rate_limit_condition:
+            self._request_times.append(time.monotonic())
+            self._rate_limit_condition.notify_all()
     
     def wait_for_rate_limit(self) -> float:
         """Wait until we can make a request, returns wait time"""
-        while not self.can_make_request():
-            time.sleep(0.5)
-        return 0
+        start = time.monotonic()
+        with self._rate_limit_condition:
+            # Sleep exactly until the next slot frees up rather than polling
+            while (delay := self._seconds_until_request_allowed()) > 0:
+                self._rate_limit_condition.wait(timeout=delay)
+        return time.monotonic() - start
+    
+    def reserve_request(self) -> float:
+        """Wait for a free slot and claim it in one step (safe with concurrent callers), returns wait time"""
+        start = time.monotonic()
+        with self._rate_limit_condition:
+            while (delay := self._seconds_until_request_allowed()) > 0:
+                self._rate_limit_condition.wait(timeout=delay)
+            self._request_times.append(time.monotonic())
+            self._rate_limit_condition.notify_all()
+        return time.monotonic() - start
+    
+    def try_reserve_requests(self, count: int = 1) -> bool:
+        """Claim count slots in one step if they are all free right now; never waits"""
+        with self._rate_limit_condition:
+            now = time.monotonic()
+            in_window = sum(1 for t in self._request_times if now - t < RATE_LIMIT_WINDOW_SECONDS)
+            if in_window + count > RATE_LIMIT_REQUESTS:
+                return False
+            self._request_times.extend([now] * count)
+            self._rate_limit_condition.notify_all()
+            return True
     
     # ==================== Statistics ====================
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        with self._cursor() as cursor:
-            cursor.execute('SELECT COUNT(*) FROM stations')
-            total_stations = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM prices')
-            total_prices = cursor.fetchone()[0]
-            
-            cutoff = (datetime.utcnow() - timedelta(hours=CACHE_EXPIRY_HOURS)).isoformat()
-            cursor.execute('SELECT COUNT(*) FROM stations WHERE updated_at >= ?', (cutoff,))
-            fresh_stations = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM update_queue')
-            queue_size = cursor.fetchone()[0]
+        cutoff = (datetime.utcnow() - timedelta(hours=CACHE_EXPIRY_HOURS)).isoformat()
+        with self._read_cursor() as cursor:
+            # One statement, so all counts come from the same snapshot
+            cursor.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM stations),
+                    (SELECT COUNT(*) FROM prices),
+                    (SELECT COUNT(*) FROM stations WHERE updated_at >= ?),
+                    (SELECT COUNT(*) FROM update_queue)
+            ''', (cutoff,))
+            total_stations, total_prices, fresh_stations, queue_size = cursor.fetchone()
             
             return {
                 'total_stations': total_stations,
@@ -562,33 +1254,94 @@ class StationCache:
     def log_update(self, pool_id: str, update_type: str, success: bool,
                    error_message: str = None, duration_ms: int = None):
         """Log an update attempt"""
+        self.log_updates_bulk([(pool_id, update_type, success, error_message, duration_ms)])
+    
+    def log_updates_bulk(self, entries: List[Tuple[str, str, bool, Optional[str], Optional[int]]]):
+        """Log many (pool_id, update_type, success, error_message, duration_ms) attempts in one transaction"""
+        if not entries:
+            return
         with self._cursor() as cursor:
-            cursor.execute('''
+            cursor.executemany('''
                 INSERT INTO update_log (pool_id, update_type, success, error_message, duration_ms)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (pool_id, update_type, 1 if success else 0, error_message, duration_ms))
+            ''', [
+                (pool_id, update_type, 1 if success else 0, error_message, duration_ms)
+                for pool_id, update_type, success, error_message, duration_ms in entries
+            ])
     
     # ==================== Cleanup ====================
     
-    def cleanup_old_logs(self, days: int = 7):
-        """Remove old update logs"""
-        with self._cursor() as cursor:
-            cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
-            cursor.execute('DELETE FROM update_log WHERE created_at < ?', (cutoff,))
+    def cleanup_old_logs(self, days: int = 7, batch_size: int = 10000):
+        """Remove old update logs, batch_size rows per transaction so writers never wait long"""
+        # created_at is written by CURRENT_TIMESTAMP, which separates date and time with a space
+        cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat(sep=' ')
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute('''
+                    DELETE FROM update_log WHERE id IN (
+                        SELECT id FROM update_log WHERE created_at < ? LIMIT ?
+                    )
+                ''', (cutoff, batch_size))
+                if cursor.rowcount < batch_size:
+                    return
     
     def vacuum(self):
         """Optimize database file"""
         conn = self._get_conn()
+        # Fold the WAL back into the database first so VACUUM rewrites everything
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
         conn.execute('VACUUM')
+        
+        # VACUUM may renumber the stations' rowids, which the R*Tree refers to
+        if self._has_rtree:
+            with self._cursor() as cursor:
+                self._rebuild_rtree(cursor)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: allows bursts of `capacity` requests, refilling at `rate` per second"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Take tokens from the bucket, waiting for it to refill if necessary.
+        Returns False if the tokens could not be acquired within timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
 
 
 # Global cache instance
 _cache_instance: Optional[StationCache] = None
+_cache_instance_lock = threading.Lock()
 
 
 def get_cache() -> StationCache:
-    """Get the global cache instance"""
+    """Get the global cache instance (created once, even if several threads ask at the same time)"""
     global _cache_instance
     if _cache_instance is None:
-        _cache_instance = StationCache()
+        with _cache_instance_lock:
+            if _cache_instance is None:
+                _cache_instance = StationCache()
     return _cache_instance